@@ -12,10 +12,20 @@ https://docs.djangoproject.com/en/1.8/ref/settings/
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 import os
+import tempfile
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 ISA_DIR = os.path.join(BASE_DIR, "tools/isa")
 
+# Simulator used for golden runs and fault simulation (patched QEMU). For benchmarks without that QEMU build:
+# QEMU_COMMAND="python3 tools/FakeQemu.py"
+QEMU_COMMAND = os.environ.get("QEMU_COMMAND", "qemu-system-riscv32")
+
+# Compression of stored mutant lists and test reports: "zstd" (needs the zstandard package, falls back to gzip),
+# "gzip" or "none". Golden runs are stored uncompressed, so that the parsers can memory-map them (existing compressed
+# golden runs are decompressed into a temporary file on every parse). Existing uncompressed files are still read.
+ARTIFACT_COMPRESSION = os.environ.get("ARTIFACT_COMPRESSION", "zstd")
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/1.8/howto/deployment/checklist/
 
@@ -43,6 +53,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'webapp.middleware.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,6 +63,14 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# webapp.middleware.QueryBudgetMiddleware: requests with more queries or slower than SLOW_REQUEST (s) are logged
+# (logger webapp.middleware) together with the queries that were repeated at least N_PLUS_ONE times. Every process
+# stores its statistics in the cache at most every PERFORMANCE_FLUSH seconds for the performance page.
+QUERY_BUDGET = 100
+SLOW_REQUEST = 1.0
+N_PLUS_ONE = 10
+PERFORMANCE_FLUSH = 10.0
+
 ROOT_URLCONF = 'app_main.urls'
 
 TEMPLATES = [
@@ -118,6 +137,17 @@ STATICFILES_DIRS = (
 )
 STATIC_URL = '/static/'
 
+# Cached ISA data and page fragments (see webapp/caching.py). File based, so that the invalidation by an import in
+# another process (shell, management command) reaches all web server processes. Outside of the source tree by default,
+# CACHE_DIR must be shared by all processes of a deployment.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get("CACHE_DIR", os.path.join(tempfile.gettempdir(), 'fear-v-analysis-cache')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
 MEDIA_ROOT = os.path.join(BASE_DIR, '.files')
 MEDIA_URL = '/media/'
 
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# Benchmarks of the analysis pipeline on synthetic data, run in a throw-away test database:
+#
+#   python3 tools/Benchmark.py [--scale small|medium|large] [--save FILE] [--compare FILE] [--tolerance 0.2]
+#
+# Golden runs and test reports come from tools/FakeQemu.py. Every stage reports its wall time, the peak RSS of the
+# benchmark process at its end (resource.getrusage, the peak only grows: compare the growth over the previous stages)
+# and the number of SQL queries. --save stores the results as baseline, --compare prints the ratios to a baseline and
+# exits with 1 if a stage got slower (or needs more memory/queries) by more than the tolerance (time: and by more than
+# MIN_TIME seconds, RSS: and by more than MIN_RSS KiB). The baseline of the small scale is tools/benchmark-small.json.
+import argparse
+import json
+import os
+import random
+import resource
+import shlex
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "app_main.settings")
+
+# instructions/iterations: size of the golden run (about insns * (1 + iterations / 3) lines) and mutant list
+# (about 100 mutants per instruction); programs/coverage: number and size of the coverage sets for set cover
+SCALES = {
+    "small": dict(insns=256, iterations=30, programs=100, coverage=100, workers=1),
+    "medium": dict(insns=4096, iterations=300, programs=1000, coverage=200, workers=4),
+    "large": dict(insns=32768, iterations=1000, programs=3000, coverage=500, workers=8),
+}
+# Time (s) and RSS (KiB) differences below this are noise
+MIN_TIME = 0.5
+MIN_RSS = 16384
+
+
+class Stages:
+    def __init__(self):
+        self.results = {}
+
+    def run(self, name, f, *args, **kwargs):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        t = time.perf_counter()
+        with CaptureQueriesContext(connection) as q:
+            r = f(*args, **kwargs)
+        t = time.perf_counter() - t
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.results[name] = {"time": t, "rss": rss, "queries": len(q)}
+        print("{:<16} {:>10.3f} s {:>10.1f} MiB peak RSS {:>9} queries".format(name, t, rss / 2 ** 10, len(q)))
+        sys.stdout.flush()
+        return r
+
+
+def make_architecture():
+    # FE300 with synthetic distance-1 instruction faults (usually imported from the ISA tools)
+    from webapp.caching import invalidate
+    from webapp.models import Architecture, Instruction, InstructionFault
+    a = Architecture.objects.create("bench", "rv32imac", "ilp32", "sifive_e", "sifive-e31", "", "1048576",
+                                    ["I", "M", "A", "C", "Zicsr", "Zifencei"], ["PMP", "D-mode"], "FE300", 1, 1, 1, 1, 1, None)
+    insns = list(Instruction.objects.filter(subset__arch=a).prefetch_related("operands"))
+    faults = []
+    for i in insns:
+        msk = i.mask
+        for o in i.operands.all():
+            msk |= o.mask
+        for b in range(i.bits):
+            e = 1 << b
+            if not e & msk:
+                continue
+            w = i.opcode ^ e
+            t = next((j for j in insns if j.bits == i.bits and (w & j.mask) == j.opcode), None)
+            faults.append(InstructionFault(source=i, error_mask=e, distance=1, target=t,
+                                           effect_opcode="illegal" if t is None else ("none" if t == i else "newop")))
+    InstructionFault.objects.bulk_create(faults, batch_size=2000)
+    # Bulk created without signals: outdate the cached ISA data (e.g. fault targets) of the architecture
+    invalidate(a.pk)
+    return a
+
+
+def parse(sw):
+    from tools.GoldenRunParser import GoldenRunParser
+    with GoldenRunParser(sw.arch, sw.lst.path) as dp:
+        dp.get_all_gpr_accesses()
+        dp.get_all_csr_accesses()
+        dp.get_all_mem_accesses()
+        dp.get_instruction_faults()
+
+
+def make_coverage_sets(arch, programs, size):
+    # Programs with overlapping sets of killed GPR and IMEM mutants (the fault coverage used by set cover)
+    from webapp.models import InstructionCoverage, InstructionFault, Mutant, MutantList, Outcome, Software
+    rng = random.Random(0)
+    killed = Outcome.objects.code("wrong result")
+    ifaults = list(InstructionFault.objects.filter(source__subset__arch=arch).values_list("id", "source_id",
+                                                                                          "error_mask"))
+    gprs = [(r, 1 << b) for r in range(1, 32) for b in range(32)]
+    for p in range(programs):
+        sw = Software.objects.create(arch=arch, name="bench-cover-{}".format(p), time=rng.randint(1000, 100000))
+        ml = MutantList(software=sw)
+        ml.save()
+        items = []
+        executed = set()
+        for n in range(size):
+            # Skewed towards the first items, so that there are rare items which are hard to cover
+            if rng.random() < 0.5:
+                r, e = gprs[int(len(gprs) * rng.random() ** 2)]
+                items.append(Mutant(parent=ml, kind=Mutant.Kind.GPR_PERMANENT_FLIP, nr_or_address=r, bitflip=e,
+                                    outcome_id=killed))
+            else:
+                i, insn, e = ifaults[int(len(ifaults) * rng.random() ** 2)]
+                items.append(Mutant(parent=ml, kind=Mutant.Kind.IMEM_PERMANENT_FLIP, nr_or_address=0, bitflip=e,
+                                    ifault_id=i, outcome_id=killed))
+                executed.add(insn)
+        Mutant.objects.bulk_create(items, batch_size=2000)
+        # Weights of the 'iinst' and 'iexec' set covers
+        InstructionCoverage.objects.bulk_create([
+            InstructionCoverage(software=sw, instruction_id=i, x=rng.randint(1, 1000), instances=rng.randint(1, 10))
+            for i in sorted(executed)])
+    return Software.objects.filter(name__startswith="bench-cover-")
+
+
+def benchmark(scale):
+    from django.core.files.base import ContentFile
+    from webapp.models import MutantList, Software
+    from webapp.utils import analyze_hwcoverage
+
+    stages = Stages()
+    os.environ["FAKE_QEMU_INSNS"] = str(scale["insns"])
+    os.environ["FAKE_QEMU_ITERATIONS"] = str(scale["iterations"])
+
+    arch = stages.run("architecture", make_architecture)
+    sw = Software.objects.create(arch=arch, name="bench")
+    sw.elf.save("bench.elf", ContentFile(b""))
+    stages.run("gen_lst", sw.gen_lst)
+    stages.run("parse", parse, sw)
+    stages.run("coverage", analyze_hwcoverage, sw)
+    ml = stages.run("mutants", MutantList.objects.create, software=sw, with_transient_faults=False,
+                    with_address_pruning=True, with_imem_prediction=True)
+    stages.run("run_tests", ml.run_tests, verbose=False, workers=scale["workers"])
+    stages.run("read_results", ml.read_results)
+    stages.run("all_faults", arch.all_faults)
+    programs = make_coverage_sets(arch, scale["programs"], scale["coverage"])
+    stages.run("set_cover", programs.set_cover)
+    for tpe in ("time", "iinst", "iexec"):
+        stages.run("set_cover_" + tpe, programs.weighted_set_cover, tpe)
+    return stages.results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print("\n{:<16} {:>10} {:>10} {:>10}".format("vs. baseline", "time", "rss", "queries"))
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None or "rss" not in b:
+            continue
+        ratios = [r[k] / b[k] if b[k] > 0 else 1.0 for k in ("time", "rss", "queries")]
+        print("{:<16} {:>9.2f}x {:>9.2f}x {:>9.2f}x".format(name, *ratios))
+        if (ratios[0] > 1.0 + tolerance and r["time"] - b["time"] > MIN_TIME) or \
+                (ratios[1] > 1.0 + tolerance and r["rss"] - b["rss"] > MIN_RSS) or ratios[2] > 1.0 + tolerance:
+            regressions.append(name)
+    if regressions:
+        print("\nREGRESSION in: {}".format(", ".join(regressions)))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline on synthetic data.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--save", help="store the results as baseline (JSON)")
+    parser.add_argument("--compare", help="compare the results to a baseline (JSON)")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import override_settings
+
+    qemu = "{} {}".format(shlex.quote(sys.executable), shlex.quote(os.path.join(BASE_DIR, "tools", "FakeQemu.py")))
+    with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media, QEMU_COMMAND=qemu):
+        settings.DEBUG = False
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = benchmark(SCALES[args.scale])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"scale": args.scale, "database": connection.vendor, "stages": results}, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        if baseline["scale"] != args.scale:
+            print("WARNING: baseline was measured with --scale {}".format(baseline["scale"]))
+        if baseline.get("database", connection.vendor) != connection.vendor:
+            print("WARNING: baseline was measured with {}".format(baseline["database"]))
+        if compare(results, baseline["stages"], args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# Stand-in for the patched qemu-system-riscv32 (settings.QEMU_COMMAND = "python3 tools/FakeQemu.py"), e.g. to
+# benchmark the pipeline on machines without that QEMU build. Accepts the same command lines as Software.gen_lst()
+# and MutantList.run_tests() and writes a synthetic golden run (-d in_asm,goldenrun -D <lst>) or test report
+# (-mutant-list <file> -test-report <file>). Both are derived from the -kernel path, so they fit to each other.
+#
+# Configuration (environment):
+#   FAKE_QEMU_INSNS       number of instructions in the program (256)
+#   FAKE_QEMU_ITERATIONS  number of times the program is executed in the golden run (100)
+#   FAKE_QEMU_GOLDEN_US   runtime of the golden run in us (1000), each run really spends it on its own golden run
+#   FAKE_QEMU_STARTUP     startup time of QEMU in s (0.2)
+#   FAKE_QEMU_OUTCOMES    outcome mix, e.g. "not killed=0.5;timeout=0.02;wrong result=0.48"
+#   FAKE_QEMU_REALTIME    really sleep this fraction of each reported runtime (0)
+#   FAKE_QEMU_HANG        ids of mutants to hang on, comma-separated
+#   FAKE_QEMU_CRASH       ids of mutants to crash on (exit code 134), comma-separated
+#   FAKE_QEMU_SEED        additional random seed
+import os
+import random
+import sys
+import time
+import zlib
+
+ABI = ["zero", "ra", "sp", "gp", "tp", "t0", "t1", "t2", "s0", "s1", "a0", "a1", "a2", "a3", "a4", "a5",
+       "a6", "a7", "s2", "s3", "s4", "s5", "s6", "s7", "s8", "s9", "s10", "s11", "t3", "t4", "t5", "t6"]
+CSRS = {0x300: "mstatus", 0x305: "mtvec", 0x340: "mscratch", 0x341: "mepc", 0x342: "mcause"}
+# Code in flash, data in DTIM (FE300 memory map)
+TEXT = 0x20400000
+DATA = 0x80000000
+OUTCOMES = "not killed=0.55;timeout=0.02;trap: illegal instruction=0.13;trap: load/store address fault=0.05;" \
+           "wrong result=0.25"
+
+
+def env(name, default):
+    return type(default)(os.environ.get("FAKE_QEMU_" + name, default))
+
+
+def arg(argv, option, default=None):
+    return argv[argv.index(option) + 1] if option in argv else default
+
+
+def r_type(funct3, rd, rs1, rs2):
+    return (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | 0x33
+
+
+def i_type(opcode, funct3, rd, rs1, imm):
+    return ((imm & 0xFFF) << 20) | (rs1 << 15) | (funct3 << 12) | (rd << 7) | opcode
+
+
+def s_type(funct3, rs1, rs2, imm):
+    return ((imm >> 5) << 25) | (rs2 << 20) | (rs1 << 15) | (funct3 << 12) | ((imm & 0x1F) << 7) | 0x23
+
+
+def program(rng, n):
+    # [(word, mnemonic, ops, reads, writes, csr, memory access (base register, offset, size, store))]
+    regs = list(range(5, 32))
+    bases = [8, 9]  # s0, s1 always point to the data section
+    code = [(0x80000437, "lui", "s0,0x80000", [], [8], None, None),
+            (0x00040493, "addi", "s1,s0,0", [8], [9], None, None)]
+    while len(code) < n:
+        rd, rs1, rs2 = rng.choice(regs[2:]), rng.choice(regs), rng.choice(regs)
+        k = rng.randrange(8)
+        if k == 0:
+            imm = rng.randrange(-64, 64)
+            code.append((i_type(0x13, 0, rd, rs1, imm), "addi", "{},{},{}".format(ABI[rd], ABI[rs1], imm),
+                         [rs1], [rd], None, None))
+        elif k < 4:
+            funct3, name = rng.choice([(0, "add"), (4, "xor"), (6, "or"), (7, "and")])
+            code.append((r_type(funct3, rd, rs1, rs2), name, "{},{},{}".format(ABI[rd], ABI[rs1], ABI[rs2]),
+                         [rs1, rs2], [rd], None, None))
+        elif k < 6:
+            base, offset = rng.choice(bases), 4 * rng.randrange(32)
+            code.append((i_type(0x03, 2, rd, base, offset), "lw", "{},{}({})".format(ABI[rd], offset, ABI[base]),
+                         [base], [rd], None, (base, offset, 4, False)))
+        elif k < 7:
+            base, offset = rng.choice(bases), rng.randrange(128)
+            if offset % 4 == 0:
+                code.append((s_type(2, base, rs2, offset), "sw", "{},{}({})".format(ABI[rs2], offset, ABI[base]),
+                             [base, rs2], [], None, (base, offset, 4, True)))
+            else:
+                code.append((s_type(0, base, rs2, offset), "sb", "{},{}({})".format(ABI[rs2], offset, ABI[base]),
+                             [base, rs2], [], None, (base, offset, 1, True)))
+        else:
+            csr = rng.choice(list(CSRS))
+            code.append((i_type(0x73, 2, rd, 0, csr), "csrrs", "{},{},zero".format(ABI[rd], CSRS[csr]),
+                         [], [rd], csr, None))
+    return code
+
+
+def startup():
+    time.sleep(env("STARTUP", 0.2) + env("GOLDEN_US", 1000) / 1e6)
+
+
+def golden_run(argv, rng):
+    code = program(rng, env("INSNS", 256))
+    iterations = env("ITERATIONS", 100)
+    gpr = {}
+    csr = {}
+    mem = {}
+    ldst = []
+    startup()
+    with open(arg(argv, "-D"), "w") as f:
+        for i, (word, mnemonic, ops, reads, writes, c, access) in enumerate(code):
+            f.write("0x{:08x}:  {:08x}          {:<15} {}\n".format(TEXT + 4 * i, word, mnemonic, ops))
+
+        # The golden run executes the whole program several times
+        for n in range(iterations):
+            for word, mnemonic, ops, reads, writes, c, access in code:
+                for r in reads:
+                    rw = gpr.get(r, (0, 0))
+                    gpr[r] = (rw[0] + 1, rw[1])
+                    if access is not None and r == access[0]:
+                        # Accesses are numbered over all reads and writes of a register (see Mutant.access_idx)
+                        ldst.append((r, sum(gpr[r]), DATA, access[1]))
+                for r in writes:
+                    rw = gpr.get(r, (0, 0))
+                    gpr[r] = (rw[0], rw[1] + 1)
+                if c is not None:
+                    csr[c] = (csr.get(c, 0) + 1)
+                if access is not None:
+                    key = (access[2], DATA + access[1])
+                    rw = mem.get(key, (0, 0))
+                    mem[key] = (rw[0], rw[1] + 1) if access[3] else (rw[0] + 1, rw[1])
+
+        for r, (reads, writes) in sorted(gpr.items()):
+            f.write("GPR[{}]:{},{},{}\n".format(r, reads, writes, reads + writes))
+        for c, reads in sorted(csr.items()):
+            f.write("CSR[{}]:{},{},{}\n".format(c, reads, 0, reads))
+        for i in range(len(code)):
+            f.write("EXE[{:08x}]:{}\n".format(TEXT + 4 * i, iterations))
+        for (size, loc), (reads, writes) in sorted(mem.items()):
+            f.write("MEM_{}[{:08x}]:{},{},{}\n".format(8 * size, loc, reads, writes, reads + writes))
+        for r, access, base, offset in ldst:
+            f.write("LD/ST for GPR {} (Access {}): [{:08x} + {}]\n".format(r, access, base, offset))
+
+
+def test_report(argv, rng):
+    golden = env("GOLDEN_US", 1000)
+    realtime = env("REALTIME", 0.0)
+    hang = set(int(i) for i in env("HANG", "").split(",") if i)
+    crash = set(int(i) for i in env("CRASH", "").split(",") if i)
+    outcomes = []
+    weights = []
+    for o in env("OUTCOMES", OUTCOMES).split(";"):
+        text, w = o.rsplit("=", 1)
+        outcomes.append(text.strip())
+        weights.append(float(w))
+
+    with open(arg(argv, "-mutant-list"), "r") as f, open(arg(argv, "-test-report"), "w") as out:
+        # Like QEMU: the report stays empty during startup and the golden run
+        startup()
+        out.write("# Golden run took {} us to complete...\n".format(golden))
+        out.flush()
+        for line in f:
+            if line.startswith("#"):
+                continue
+            i = int(line.split(",", 1)[0], 10)
+            if i in hang:
+                while True:
+                    time.sleep(60)
+            if i in crash:
+                return 134
+            outcome = rng.choices(outcomes, weights)[0]
+            runtime = 10 * golden if outcome == "timeout" else int(golden * rng.uniform(0.05, 1.2))
+            if realtime > 0:
+                time.sleep(realtime * runtime / 1e6)
+            # One line per mutant as soon as it is done (like QEMU)
+            out.write("  {}, {}, {} us\n".format(i, outcome, runtime))
+            out.flush()
+
+
+def main(argv):
+    kernel = arg(argv, "-kernel", "")
+    rng = random.Random(zlib.crc32(os.path.basename(kernel).encode()) + env("SEED", 0))
+    if "-mutant-list" in argv:
+        return test_report(argv, rng) or 0
+    elif "-D" in argv:
+        golden_run(argv, rng)
+    else:
+        print("ERROR: expected either -D <lst> or -mutant-list <file> -test-report <file>", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,23 +1,30 @@
 import re
+from functools import cached_property
+from webapp.artifacts import map_artifact
 from webapp.models import *
 
 
 class GoldenRunParser:
+    # The regexes work on bytes and scan the memory-mapped golden run as a whole, the lines are never decoded or
+    # copied. Each regex starts with a literal (fast search), the lookbehind after it anchors it at the start of a
+    # line; re_inst has no literal (the 0x prefix is optional) and is anchored with ^. Horizontal whitespace only
+    # ([ \t]), so that no match spans several lines.
     re_inst = re.compile(
-        r'^(?:0x)?(?P<address>[0-9a-fA-F]{8}):\s+(?P<instruction>\S+)\s+'
-        r'(?P<mnemonic>\S+)\s*(?P<ops>[\w,()-]+)?\s*\s+(?:#.*)?')
+        rb'^(?:0x)?(?P<address>[0-9a-fA-F]{8}):[ \t]+(?P<instruction>\S+)[ \t]+'
+        rb'(?P<mnemonic>\S+)[ \t]*(?P<ops>[\w,()-]+)?(?=\s|\Z)', re.MULTILINE)
     re_regs = re.compile(r'^(?:-?[0-9]+\()?(?P<reg>[^-\d][^,\s()]+)\)?$')
     re_gpr_filter = re.compile(
-        r'^LD/ST for GPR (?P<gpr>\d+) \(Access (?P<access>\d+)\): \[(?P<base>[0-9a-fA-F]{8})\s\+\s(?P<offset>-?\d+)]$')
-
-    re_gpr_summary = re.compile(r'^GPR\[(?P<idx>\d+)]:(?P<read>\d+),(?P<write>\d+),(?P<total>\d+)$')
-    re_csr_summary = re.compile(r'^CSR\[(?P<idx>\d+)]:(?P<read>\d+),(?P<write>\d+),(?P<total>\d+)$')
-    re_insn_exe = re.compile(r'^EXE\[(?P<pc>[0-9a-fA-F]+)]:(?P<total>\d+)$')
-
-    # TO DO: Would be better to merge the three regexes below into one and handle all mem accesses in the same way...
-    re_mem8_rwx = re.compile(r'^MEM_8\[(?P<loc>[0-9a-fA-F]+)]:(?P<read>\d+),(?P<write>\d+),(?P<total>\d+)$')
-    re_mem16_rwx = re.compile(r'^MEM_16\[(?P<loc>[0-9a-fA-F]+)]:(?P<read>\d+),(?P<write>\d+),(?P<total>\d+)$')
-    re_mem32_rwx = re.compile(r'^MEM_32\[(?P<loc>[0-9a-fA-F]+)]:(?P<read>\d+),(?P<write>\d+),(?P<total>\d+)$')
+        rb'LD/ST for GPR (?<![^\n]LD/ST for GPR )(?P<gpr>\d+) \(Access (?P<access>\d+)\): '
+        rb'\[(?P<base>[0-9a-fA-F]{8}) \+ (?P<offset>-?\d+)]$', re.MULTILINE)
+
+    re_gpr_summary = re.compile(
+        rb'GPR\[(?<![^\n]GPR\[)(?P<idx>\d+)]:(?P<read>\d+),(?P<write>\d+),(?P<total>\d+)$', re.MULTILINE)
+    re_csr_summary = re.compile(
+        rb'CSR\[(?<![^\n]CSR\[)(?P<idx>\d+)]:(?P<read>\d+),(?P<write>\d+),(?P<total>\d+)$', re.MULTILINE)
+    re_insn_exe = re.compile(rb'EXE\[(?<![^\n]EXE\[)(?P<pc>[0-9a-fA-F]+)]:(?P<total>\d+)$', re.MULTILINE)
+    re_mem_rwx = re.compile(
+        rb'MEM_(?<![^\n]MEM_)(?P<size>8|16|32)\[(?P<loc>[0-9a-fA-F]+)]:(?P<read>\d+),(?P<write>\d+),(?P<total>\d+)$',
+        re.MULTILINE)
 
     def __init__(self, arch, disassembly_file):
         self.insn_list = Instruction.objects.filter(subset__arch=arch)
@@ -25,11 +32,12 @@ class GoldenRunParser:
         self.fprs = Fpr.objects.filter(subset__arch=arch)
         self.csrs = Csr.objects.filter(subset__arch=arch)
         self.pc_values = set()
+        self.pc2word = dict()
+        self.word2insn = dict()
         self.arch = arch
 
         self.disas_file = disassembly_file
-        with open(disassembly_file, 'r') as f:
-            self.goldenrun_lines = f.readlines()
+        self.buf = map_artifact(disassembly_file)
 
         self.pc2insn = dict()
         # 1) ROM Reset Vector
@@ -42,84 +50,105 @@ class GoldenRunParser:
         # self.pc2insn[0x00001010] = self.get_instruction("0x00001010:  0182a283          lw              t0,24(t0)")
         # self.pc2insn[0x00001014] = self.get_instruction("0x00001014:  00028067          jr              t0")
         # 2) Parse the objdump of the executable sections:
-        for line in self.goldenrun_lines:
-            m = GoldenRunParser.re_inst.match(line)
-            if m is not None:
-                pc = int(m.group('address').strip(), 16)
-                insn = self.get_instruction(line)
-                if pc is not None and insn is not None:
-                    self.pc2insn[pc] = insn
+        for m in GoldenRunParser.re_inst.finditer(self.buf):
+            self.match_instruction(m)
 
+        # 3) Memory range touched by the golden run (see filter_gprs):
         self.min = None
         self.max = None
-        for line in self.goldenrun_lines:
-            m8 = GoldenRunParser.re_mem8_rwx.match(line)
-            m16 = GoldenRunParser.re_mem16_rwx.match(line)
-            m32 = GoldenRunParser.re_mem32_rwx.match(line)
-
-            if m8 is not None:
-                loc = int(m8.group("loc"), 16)
-                loc2 = loc
-            elif m16 is not None:
-                loc = int(m16.group("loc"), 16)
-                loc2 = loc + 1
-            elif m32 is not None:
-                loc = int(m32.group("loc"), 16)
-                loc2 = loc + 3
-            else:
-                continue
-
+        for m in GoldenRunParser.re_mem_rwx.finditer(self.buf):
+            loc = int(m.group("loc"), 16)
+            loc2 = loc + int(m.group("size")) // 8 - 1
             if self.min is None or loc < self.min:
                 self.min = loc
             if self.max is None or loc2 >= self.max:
                 self.max = loc2
 
+    @cached_property
+    def filter_gprs(self):
+        # Base/offset of every LD/ST access (used to prune transient GPR faults), parsed on first use because
+        # there is one line per executed load/store
+        return {(int(m.group('gpr')), int(m.group('access'))): (int(m.group('base'), 16), int(m.group('offset'), 10))
+                for m in GoldenRunParser.re_gpr_filter.finditer(self.buf)}
+
+    def close(self):
+        if not isinstance(self.buf, bytes):
+            self.buf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def is_address_fault(self, gpr, access, bitflip):
+        # A transient fault in the base register of a load/store crashes the program for certain, if the faulty
+        # address lies outside of the memory range accessed during the golden run.
+        if (gpr, access) not in self.filter_gprs or self.min is None:
+            return False
+        base, offset = self.filter_gprs[gpr, access]
+        faulty_address = ((base ^ bitflip) + offset) & 0xFFFFFFFF
+        return faulty_address < self.min or faulty_address > self.max
+
     @staticmethod
     def get_registers(line):
         regs = set()
-        m = GoldenRunParser.re_inst.match(line)
-        re_regs = GoldenRunParser.re_regs
+        m = GoldenRunParser.re_inst.match(line.encode() if isinstance(line, str) else line)
         if m is not None:
-            ops = m.group('ops')
-            if ops is not None:
-                for o in list(filter(None, re.split(r'[,()]', ops))):
-                    if re_regs.match(o):
-                        regs.add(re_regs.match(o).group('reg'))
+            regs = GoldenRunParser.ops_registers(m.group('ops'))
+        return regs
+
+    @staticmethod
+    def ops_registers(ops):
+        regs = set()
+        re_regs = GoldenRunParser.re_regs
+        if ops is not None:
+            for o in list(filter(None, re.split(r'[,()]', ops.decode()))):
+                if re_regs.match(o):
+                    regs.add(re_regs.match(o).group('reg'))
         return regs
 
     def get_instruction(self, line):
-        m = GoldenRunParser.re_inst.match(line)
+        m = GoldenRunParser.re_inst.match(line.encode() if isinstance(line, str) else line)
         if m is not None:
-            # This line corresponds to an instuction in the binary:
-            instruction = int(''.join(reversed(m.group('instruction').strip().split(' '))), 16)
-
-            # Store PC value
-            self.pc_values.add(int(m.group('address'), 16))
-
-            # Try to match opcode
-            for i in self.insn_list:
-                if (instruction & i.mask) == i.opcode:
-                    self.pc2insn[int(m.group('address'), 16)] = i
-                    return i
-
-            # Regex matched but not corresponding instruction was found!
-            print("   [WARNING] cannot match opcode '" + m.group("instruction") + " (" + m.group(
-                'mnemonic') + ")' @ " + format(int(m.group('address'), 16), '#08x'))
+            return self.match_instruction(m)
+        return None
 
+    def match_instruction(self, m):
+        # This line corresponds to an instuction in the binary:
+        address = int(m.group('address'), 16)
+        instruction = int(m.group('instruction'), 16)
+
+        # Store PC value and instruction word
+        self.pc_values.add(address)
+        self.pc2word[address] = instruction
+
+        # Try to match opcode (the same words recur in every translation block that contains them)
+        if instruction not in self.word2insn:
+            self.word2insn[instruction] = next((i for i in self.insn_list if (instruction & i.mask) == i.opcode), None)
+        i = self.word2insn[instruction]
+        if i is not None:
+            self.pc2insn[address] = i
+            return i
+
+        # Regex matched but not corresponding instruction was found!
+        print("   [WARNING] cannot match opcode '" + m.group("instruction").decode() + " (" + m.group(
+            'mnemonic').decode() + ")' @ " + format(address, '#08x'))
         return None
 
     @staticmethod
     def get_address(line):
-        m = GoldenRunParser.re_inst.match(line)
+        m = GoldenRunParser.re_inst.match(line.encode() if isinstance(line, str) else line)
         if m is not None:
-            address = int(m.group('address').strip(), 16)
+            address = int(m.group('address'), 16)
             return address
         return None
 
     def get_covered_registers(self):
+        all_operands = set(m.group('ops') for m in GoldenRunParser.re_inst.finditer(self.buf))
         all_register_names = set()
-        for line in self.goldenrun_lines:
-            all_register_names = all_register_names.union(self.get_registers(line))
+        for ops in all_operands:
+            all_register_names = all_register_names.union(self.ops_registers(ops))
 
         gprs = self.gprs.filter(abiname__in=list(all_register_names))
         fprs = self.fprs.filter(abiname__in=list(all_register_names))
@@ -133,68 +162,54 @@ class GoldenRunParser:
 
     def get_instruction_faults(self):
         result = []
-        for line in self.goldenrun_lines:
-            i = self.get_instruction(line)
+        for m in GoldenRunParser.re_inst.finditer(self.buf):
+            i = self.match_instruction(m)
             if i is not None:
-                a = self.get_address(line)
-                result.append((a, i))
-                self.pc2insn[a] = i
+                result.append((int(m.group('address'), 16), i))
         return result
 
     def get_all_gpr_accesses(self):
         gpr_access = dict()
-        for line in self.goldenrun_lines:
-            m = GoldenRunParser.re_gpr_summary.match(line)
-            if m is not None:
-                idx = int(m.group("idx"))
-                if idx not in gpr_access:
-                    gpr_access[idx] = (int(m.group("read")), int(m.group("write")), int(m.group("total")))
-                else:
-                    raise Exception("GPR Reads", "already parsed read count for GPR {}!".format(idx))
+        for m in GoldenRunParser.re_gpr_summary.finditer(self.buf):
+            idx = int(m.group("idx"))
+            if idx not in gpr_access:
+                gpr_access[idx] = (int(m.group("read")), int(m.group("write")), int(m.group("total")))
+            else:
+                raise Exception("GPR Reads", "already parsed read count for GPR {}!".format(idx))
         return gpr_access
 
     def get_all_csr_accesses(self):
         csr_access = dict()
-        for line in self.goldenrun_lines:
-            m = GoldenRunParser.re_csr_summary.match(line)
-            if m is not None:
-                idx = int(m.group("idx"))
-                csr_access[idx] = (int(m.group("read")), int(m.group("write")), int(m.group("total")))
+        for m in GoldenRunParser.re_csr_summary.finditer(self.buf):
+            idx = int(m.group("idx"))
+            csr_access[idx] = (int(m.group("read")), int(m.group("write")), int(m.group("total")))
         return csr_access
 
     def get_all_mem_accesses(self):
-        mem8 = dict()
-        mem16 = dict()
-        mem32 = dict()
-        for line in self.goldenrun_lines:
-            m8 = GoldenRunParser.re_mem8_rwx.match(line)
-            m16 = GoldenRunParser.re_mem16_rwx.match(line)
-            m32 = GoldenRunParser.re_mem32_rwx.match(line)
-            if m8 is not None:
-                loc = int(m8.group("loc"), 16)
-                mem8[loc] = (int(m8.group("read")), int(m8.group("write")), int(m8.group("total")))
-            elif m16 is not None:
-                loc = int(m16.group("loc"), 16)
-                mem16[loc] = (int(m16.group("read")), int(m16.group("write")), int(m16.group("total")))
-            elif m32 is not None:
-                loc = int(m32.group("loc"), 16)
-                mem32[loc] = (int(m32.group("read")), int(m32.group("write")), int(m32.group("total")))
-        return mem8, mem16, mem32
+        mem = {b"8": dict(), b"16": dict(), b"32": dict()}
+        for m in GoldenRunParser.re_mem_rwx.finditer(self.buf):
+            loc = int(m.group("loc"), 16)
+            mem[m.group("size")][loc] = (int(m.group("read")), int(m.group("write")), int(m.group("total")))
+        return mem[b"8"], mem[b"16"], mem[b"32"]
+
+    def get_pc_executions(self):
+        pc2count = {}
+        for m in GoldenRunParser.re_insn_exe.finditer(self.buf):
+            pc2count[int(m.group('pc'), 16)] = int(m.group("total"))
+        return pc2count
 
     def get_instruction_executions(self):
         insn2count = {}
-        for line in self.goldenrun_lines:
-            m = GoldenRunParser.re_insn_exe.match(line)
-            if m is not None:
-                pc = int(m.group('pc').strip(), 16)
-                count = int(m.group("total"))
-                if pc not in self.pc2insn:
-                    print("   [WARNING] instruction @ '{}' not found in file '{}'!".format(hex(pc), self.disas_file))
-                    continue
-                i = self.pc2insn[pc]
-                if i not in insn2count:
-                    insn2count[i] = 0
-                insn2count[i] = insn2count[i] + count
+        for m in GoldenRunParser.re_insn_exe.finditer(self.buf):
+            pc = int(m.group('pc'), 16)
+            count = int(m.group("total"))
+            if pc not in self.pc2insn:
+                print("   [WARNING] instruction @ '{}' not found in file '{}'!".format(hex(pc), self.disas_file))
+                continue
+            i = self.pc2insn[pc]
+            if i not in insn2count:
+                insn2count[i] = 0
+            insn2count[i] = insn2count[i] + count
         return insn2count
 
     def get_instruction_instances(self):
@@ -5,6 +5,7 @@ from django.contrib import admin
 admin.site.register(Operand)
 admin.site.register(SoftwareList)
 admin.site.register(Software)
+admin.site.register(StageMetric)
 admin.site.register(Gpr)
 admin.site.register(Fpr)
 admin.site.register(Csr)
@@ -12,4 +13,5 @@ admin.site.register(Instruction)
 admin.site.register(Device)
 admin.site.register(MutantList)
 admin.site.register(Mutant)
+admin.site.register(Outcome)
 admin.site.register(Architecture)
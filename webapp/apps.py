@@ -0,0 +1,17 @@
+from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def reserve_outcomes(sender, using, **kwargs):
+    # Outcome codes with a fixed meaning (see managers.mutants.RESERVED_OUTCOMES)
+    from .models import Outcome
+    Outcome.objects.db_manager(using).reserve()
+
+
+class WebappConfig(AppConfig):
+    name = 'webapp'
+
+    def ready(self):
+        # Invalidation of the cached ISA data (see webapp/caching.py)
+        from . import signals  # noqa: F401
+        post_migrate.connect(reserve_outcomes, sender=self)
@@ -0,0 +1,143 @@
+import gzip
+import hashlib
+import io
+import mmap
+import os
+import re
+import shutil
+import tempfile
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+SUFFIX = {"gzip": ".gz", "zstd": ".zst"}
+re_digest = re.compile(r"^[0-9a-f]{64}$")
+
+
+def compression():
+    # Compression of new artifacts (settings.ARTIFACT_COMPRESSION): "zstd" (falls back to gzip), "gzip" or None
+    method = getattr(settings, "ARTIFACT_COMPRESSION", None)
+    if method in (None, "", "none"):
+        return None
+    if method == "zstd" and zstandard is None:
+        return "gzip"
+    return method
+
+
+def store(field, name, path, save=True, compress=True):
+    # Save the file at path to a FileField (golden run, mutant list, test report), compressed while copying unless
+    # compress is False
+    method = compression() if compress else None
+    if method is None:
+        with open(path, "rb") as f:
+            field.save(name, File(f), save=save)
+        return
+
+    with tempfile.TemporaryFile() as tmp:
+        with open(path, "rb") as f:
+            if method == "zstd":
+                with zstandard.ZstdCompressor(level=3).stream_writer(tmp, closefd=False) as out:
+                    shutil.copyfileobj(f, out, 1 << 20)
+            else:
+                # mtime=0: the same content always gives the same file (see ContentAddressedStorage)
+                with gzip.GzipFile(fileobj=tmp, mode="wb", compresslevel=6, mtime=0) as out:
+                    shutil.copyfileobj(f, out, 1 << 20)
+        tmp.seek(0)
+        field.save(name + SUFFIX[method], File(tmp), save=save)
+
+
+def _open(path):
+    # Binary stream of an artifact, decompressed on the fly (detected by its magic number, old files are plain text)
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    if magic[:2] == GZIP_MAGIC:
+        return gzip.open(path, "rb")
+    if magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise RuntimeError("Cannot read '{}': zstd compressed, but the zstandard module is missing.".format(path))
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return None
+
+
+def open_artifact(path):
+    # Text stream of an artifact
+    f = _open(path)
+    if f is None:
+        return open(path, "r")
+    return io.TextIOWrapper(f, encoding="UTF-8")
+
+
+def map_artifact(path):
+    # Read-only memory map of an artifact. Plain files are mapped directly (so that several processes share the page
+    # cache), compressed files are decompressed into an anonymous temporary file first (golden runs are therefore
+    # stored uncompressed, see golden_runs). Close the map after use.
+    f = _open(path)
+    if f is None:
+        f = open(path, "rb")
+    else:
+        with f:
+            tmp = tempfile.TemporaryFile()
+            shutil.copyfileobj(f, tmp, 1 << 20)
+            tmp.flush()
+        f = tmp
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def sha256(f):
+    h = hashlib.sha256()
+    for chunk in iter(lambda: f.read(1 << 20), b""):
+        h.update(chunk)
+    return h.hexdigest()
+
+
+def digest(field):
+    # SHA-256 of the content of a FileField, taken from the name if it is stored content-addressed
+    name = os.path.basename(field.name).split(".", 1)[0]
+    if re_digest.match(name):
+        return name
+    with field.open("rb") as f:
+        return sha256(f)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    # Files are stored as <upload_to>/<sha256[:2]>/<sha256><extensions>, identical files (e.g. the ELFs of
+    # programs that csmith generated twice) are stored once and shared by all FileFields that refer to them.
+    def get_available_name(self, name, max_length=None):
+        # Upload names are replaced by the content hash in _save, only a concurrent save of the same content gets an
+        # alternative name
+        if re_digest.match(os.path.basename(name).split(".", 1)[0]):
+            return super().get_available_name(name, max_length)
+        return name
+
+    def _save(self, name, content):
+        content.seek(0)
+        h = sha256(content)
+        content.seek(0)
+        head, tail = os.path.split(name)
+        parts = tail.split(".")
+        # Keep the type and the compression suffix (e.g. .lst.zst)
+        ext = "".join("." + x for x in parts[-2 if parts[-1] in ("gz", "zst") else -1:]) if len(parts) > 1 else ""
+        name = os.path.join(head, h[:2], h + ext)
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+    def release(self, field, refs):
+        # Delete the file of field unless refs (a QuerySet of the other rows that might share it) still uses it
+        if field and self.exists(field.name) and not refs.filter(**{field.field.name: field.name}).exists():
+            self.delete(field.name)
+
+
+content_storage = ContentAddressedStorage()
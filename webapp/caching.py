@@ -0,0 +1,93 @@
+import time
+from django.core.cache import cache
+from django.http import Http404
+
+# Cached ISA data (architectures, instructions, registers, devices, memory regions), which only changes when an
+# architecture is imported. Keys contain the version of the architecture (and a global version for data shared by
+# all architectures, e.g. operands), webapp.signals bumps the version on every change instead of deleting keys.
+GLOBAL = "isa:version"
+
+
+def _version_key(arch_id):
+    return GLOBAL if arch_id is None else "isa:version:{}".format(arch_id)
+
+
+def bump(key):
+    # Returns the new version
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Unknown (or evicted) version: start at a new value, so that old keys are never reused
+        value = time.time_ns()
+        cache.set(key, value, None)
+        return value
+
+
+def versions(keys):
+    # Current value of the version keys, joined by "."
+    values = cache.get_many(keys)
+    for k in keys:
+        if k not in values:
+            cache.add(k, time.time_ns(), None)
+            values[k] = cache.get(k)
+    return ".".join(str(values[k]) for k in keys)
+
+
+def invalidate(arch_id=None):
+    # Outdate all cached data of an architecture (None: of all architectures)
+    bump(_version_key(arch_id))
+
+
+def version(arch_id):
+    return versions([GLOBAL, _version_key(arch_id)])
+
+
+def _key(arch_id, name):
+    return "isa:{}:{}:{}".format(arch_id, version(arch_id), name)
+
+
+def cached(arch_id, name, f):
+    # Value of f() for the current version of the architecture
+    key = _key(arch_id, name)
+    value = cache.get(key)
+    if value is None:
+        value = f()
+        cache.set(key, value, None)
+    return value
+
+
+def architecture(arch_id):
+    from .models import Architecture
+
+    def get():
+        a = Architecture.objects.filter(pk=arch_id).first()
+        return a if a is not None else False
+
+    a = cached(arch_id, "architecture", get)
+    if a is False:
+        raise Http404("No Architecture matches the given query.")
+    return a
+
+
+def instruction(instruction_id):
+    # Instruction with subset and architecture (the architecture of an instruction id is cached as well)
+    from .models import Instruction
+    name = "instruction:{}".format(instruction_id)
+    arch_id = cache.get("isa:" + name)
+    if arch_id is not None:
+        i = cache.get(_key(arch_id, name))
+        if i is not None:
+            return i
+    i = Instruction.objects.select_related("subset__arch").filter(pk=instruction_id).first()
+    if i is None:
+        raise Http404("No Instruction matches the given query.")
+    cache.set("isa:" + name, i.subset.arch_id, None)
+    cache.set(_key(i.subset.arch_id, name), i, None)
+    return i
+
+
+def navigation(arch_id):
+    # Sidebar of the architecture pages (see include/nav.html)
+    from .models import Instruction
+    return cached(arch_id, "navigation", lambda: list(
+        Instruction.objects.filter(subset__arch_id=arch_id).order_by('name').values('id', 'name')))
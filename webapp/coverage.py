@@ -0,0 +1,284 @@
+import heapq
+from django.core.cache import cache
+from django.db.models import BooleanField, CharField, Exists, OuterRef, Value
+from django.http import Http404
+from . import caching
+
+# Context suffix -> instruction subset (None: all instructions) of the software list page
+SUBSETS = {
+    "": None,
+    "_rv32i": "I",
+    "_rv32icsr": "Zicsr",
+    "_rv32ifencei": "Zifencei",
+    "_rv32m": "M",
+    "_rv32a": "A",
+    "_rv32f": "F",
+    "_rv32d": "D",
+    "_rv32c": "C",
+    "_machine": "M-mode",
+}
+
+
+# Version of all summaries, bumped when programs are deleted
+_ALL_KEY = "softwarelist:version"
+
+
+def _version_key(softwarelist_id):
+    return "softwarelist:version:{}".format(softwarelist_id)
+
+
+def invalidate(softwarelist_ids):
+    # Outdate the cached summaries of the software lists
+    for pk in softwarelist_ids:
+        caching.bump(_version_key(pk))
+
+
+def invalidate_all():
+    # Outdate the cached summaries of all software lists (one cache operation instead of a query for the lists)
+    caching.bump(_ALL_KEY)
+
+
+def invalidate_programs(software_ids):
+    # Outdate the cached summaries of all lists containing the programs (e.g. after their coverage was analysed)
+    from .models import SoftwareList
+    invalidate(SoftwareList.objects.filter(software__in=software_ids).values_list("pk", flat=True).distinct())
+
+
+def analysed(sw):
+    # The coverage of the program was (re)analysed
+    invalidate_programs([sw.pk])
+    update_matrix(sw.arch_id, [sw.pk])
+
+
+def instruction_ratio(covered, total):
+    if total == 0:
+        return "N/A"
+    if covered == total:
+        return "100"
+    return "{0:0.1f}".format(100.0 * covered / total).replace(".0", "")
+
+
+def _registers(arch, slist):
+    # (kind, name, covered) of all registers and memory regions of the architecture in a single query
+    from .models import Gpr, Fpr, Csr, DeviceCsr, MemoryRegion, GprCoverage, FprCoverage, CsrCoverage, \
+        DeviceCsrCoverage, MemoryRegionCoverage
+    queries = []
+    for kind, model, coverage, fk, isa in (("gprs", Gpr, GprCoverage, "register", "subset__arch"),
+                                           ("fprs", Fpr, FprCoverage, "register", "subset__arch"),
+                                           ("csrs", Csr, CsrCoverage, "register", "subset__arch"),
+                                           ("dcsrs", DeviceCsr, DeviceCsrCoverage, "register", "device__arch"),
+                                           ("mr", MemoryRegion, MemoryRegionCoverage, "memory_region", "arch")):
+        covered = coverage.objects.filter(**{fk: OuterRef("pk"), "software__softwarelist": slist})
+        queries.append(model.objects.filter(**{isa: arch}).annotate(
+            kind=Value(kind, output_field=CharField()),
+            covered=Exists(covered, output_field=BooleanField())).values_list("kind", "name", "covered").order_by())
+    return queries[0].union(*queries[1:], all=True)
+
+
+def _summary(slist, arch, programs):
+    from .models import Instruction, InstructionCoverage
+    context = {'arch': arch, 'programs': programs, 'aggregates': slist.aggregate_all()}
+
+    covered = {}
+    names = {}
+    for kind, name, c in _registers(arch, slist):
+        names.setdefault(kind, set()).add(name)
+        if c:
+            covered.setdefault(kind, set()).add(name)
+    for kind in ("gprs", "fprs", "csrs", "dcsrs", "mr"):
+        n = names.get(kind, set())
+        c = covered.get(kind, set())
+        context['covered_' + kind] = sorted(c)
+        context['missing_' + kind] = sorted(n - c)
+        context['r_' + kind] = "{0:0.2f}".format(100.0 * len(c) / max(1, len(n)))
+
+    insns = {}
+    insns_covered = {}
+    for name, subset, c in Instruction.objects.filter(subset__arch=arch).annotate(covered=Exists(
+            InstructionCoverage.objects.filter(instruction=OuterRef("pk"), software__softwarelist=slist))).values_list(
+            "name", "subset__name", "covered"):
+        for s in (None, subset):
+            insns.setdefault(s, set()).add(name)
+            if c:
+                insns_covered.setdefault(s, set()).add(name)
+    for suffix, subset in SUBSETS.items():
+        n = insns.get(subset, set())
+        c = insns_covered.get(subset, set())
+        context['covered_instructions' + suffix] = sorted(c)
+        context['missing_instructions' + suffix] = sorted(n - c)
+        context['r_instructions' + suffix] = instruction_ratio(len(c), len(n))
+    return context
+
+
+def summary(slist):
+    # Coverage of the software list (see software/list.html), cached until a program of the list is added, removed,
+    # analysed or deleted or its architecture changes
+    key = "softwarelist:{}:{}".format(slist.pk, caching.versions([_ALL_KEY, _version_key(slist.pk)]))
+    cached = cache.get(key)
+    if cached is not None and cached[1] == caching.version(cached[0]):
+        return cached[2]
+
+    first = slist.software.select_related("arch").order_by("pk").first()
+    if first is None:
+        raise Http404("Software list '{}' is empty.".format(slist.name))
+    # The version is taken before the data, so that a concurrent change cannot be cached as current
+    isa_version = caching.version(first.arch_id)
+    context = _summary(slist, first.arch, slist.software.count())
+    cache.set(key, (first.arch_id, isa_version, context), None)
+    return context
+
+
+# Items of the coverage matrix: kind -> (coverage model, item field)
+ITEMS = {
+    "insn": ("InstructionCoverage", "instruction_id"),
+    "gpr": ("GprCoverage", "register_id"),
+    "csr": ("CsrCoverage", "register_id"),
+}
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:
+    def popcount(x):
+        return bin(x).count("1")
+
+
+class CoverageMatrix:
+    # Instruction, GPR and CSR coverage of the analysed programs of an architecture as bit matrix: one int per program
+    # (row) with one bit per item (column), so that unions and marginal gains over tens of thousands of programs are a
+    # few integer operations per program instead of set operations on querysets.
+    def __init__(self, items):
+        # items: [(kind, pk)] of the columns
+        self.items = items
+        self.columns = {item: n for n, item in enumerate(items)}
+        self.kinds = {}
+        for n, (kind, pk) in enumerate(items):
+            self.kinds[kind] = self.kinds.get(kind, 0) | (1 << n)
+        # software pk -> covered items
+        self.rows = {}
+
+    @classmethod
+    def build(cls, arch_id):
+        from .models import Csr, Gpr, Instruction
+        items = []
+        for kind, model in (("insn", Instruction), ("gpr", Gpr), ("csr", Csr)):
+            items += [(kind, pk) for pk in model.objects.filter(subset__arch_id=arch_id).order_by("pk").values_list(
+                "pk", flat=True)]
+        m = cls(items)
+        m.rows = m._read(software__arch_id=arch_id)
+        return m
+
+    def _read(self, **filters):
+        from . import models
+        rows = {}
+        for kind, (model, field) in ITEMS.items():
+            for sw, item in getattr(models, model).objects.filter(**filters).values_list(
+                    "software_id", field).iterator():
+                n = self.columns.get((kind, item))
+                if n is not None:
+                    rows[sw] = rows.get(sw, 0) | (1 << n)
+        return rows
+
+    def update(self, software_ids):
+        # Reread the rows of the programs (programs without coverage are removed)
+        rows = self._read(software_id__in=software_ids)
+        for pk in software_ids:
+            if pk in rows:
+                self.rows[pk] = rows[pk]
+            else:
+                self.rows.pop(pk, None)
+
+    def selection(self, kinds=None):
+        # Columns of the kinds (None: all)
+        if kinds is None:
+            return (1 << len(self.items)) - 1
+        return sum(self.kinds.get(k, 0) for k in kinds)
+
+    def union(self, programs):
+        u = 0
+        for pk in programs:
+            u |= self.rows.get(pk, 0)
+        return u
+
+    def count(self, mask, kinds=None):
+        return popcount(mask & self.selection(kinds))
+
+    def decode(self, mask, kinds=None):
+        # Items [(kind, pk)] of a mask
+        mask &= self.selection(kinds)
+        return [item for n, item in enumerate(self.items) if mask >> n & 1]
+
+    def gains(self, candidates, base=0, kinds=None):
+        # Number of items each candidate covers in addition to base: {pk: gain}
+        new = ~base & self.selection(kinds)
+        rows = self.rows
+        return {pk: popcount(rows.get(pk, 0) & new) for pk in candidates}
+
+    def rank(self, candidates, base=0, k=10, kinds=None):
+        # The k candidates with the highest gain over base (each on its own): [(pk, gain)]
+        gains = [x for x in self.gains(candidates, base, kinds).items() if x[1] > 0]
+        return heapq.nlargest(k, gains, key=lambda x: (x[1], -x[0]))
+
+    def greedy(self, candidates, base=0, k=10, kinds=None):
+        # Up to k candidates, each with the highest gain over base and the previously selected ones: [(pk, gain)].
+        # Gains only decrease, so a candidate whose updated gain is still the highest one is selected (lazy greedy).
+        wanted = self.selection(kinds)
+        covered = base
+        heap = [(-g, pk) for pk, g in self.gains(candidates, base, kinds).items() if g > 0]
+        heapq.heapify(heap)
+        selected = []
+        while heap and len(selected) < k:
+            g, pk = heapq.heappop(heap)
+            g = popcount(self.rows[pk] & ~covered & wanted)
+            if g == 0:
+                continue
+            if heap and -heap[0][0] > g:
+                heapq.heappush(heap, (-g, pk))
+                continue
+            selected.append((pk, g))
+            covered |= self.rows[pk]
+        return selected
+
+
+def _matrix_version_key(arch_id):
+    return "coverage:version:{}".format(arch_id)
+
+
+def _matrix_key(arch_id, version):
+    return "coverage:matrix:{}:{}:{}".format(arch_id, caching.version(arch_id), version)
+
+
+def matrix(arch_id):
+    # Coverage matrix of the architecture, built once and then kept up to date by update_matrix
+    key = _matrix_key(arch_id, caching.versions([_matrix_version_key(arch_id)]))
+    m = cache.get(key)
+    if m is None:
+        m = CoverageMatrix.build(arch_id)
+        cache.set(key, m, None)
+    return m
+
+
+def update_matrix(arch_id, software_ids):
+    # Apply the coverage of (re)analysed or deleted programs to the cached matrix. The updated matrix is only stored
+    # if no other update happened in between, otherwise the next matrix() rebuilds it.
+    key = _matrix_version_key(arch_id)
+    old = cache.get(key)
+    m = cache.get(_matrix_key(arch_id, old)) if old is not None else None
+    new = caching.bump(key)
+    if m is not None and new == old + 1:
+        m.update(software_ids)
+        cache.set(_matrix_key(arch_id, new), m, None)
+
+
+def suggestions(slist, k=10, kinds=None, greedy=True):
+    # Analysed programs that add the most coverage to the software list: [(Software, gain)]. With greedy, the gain of
+    # each program is the one in addition to the previous suggestions.
+    from .models import Software
+    first = slist.software.order_by("pk").first()
+    if first is None:
+        return []
+    m = matrix(first.arch_id)
+    members = set(slist.software.values_list("pk", flat=True))
+    candidates = [pk for pk in m.rows if pk not in members]
+    selected = (m.greedy if greedy else m.rank)(candidates, m.union(members), k, kinds)
+    programs = Software.objects.in_bulk([pk for pk, g in selected])
+    return [(programs[pk], g) for pk, g in selected]
@@ -0,0 +1,116 @@
+import shutil
+from django.db import connection, transaction
+from .artifacts import open_artifact
+
+
+def parse_test_report(f, golden):
+    # Single pass over a QEMU test report: yields (id, result, duration) for every mutant and appends the duration
+    # of the golden run ("# Golden run took <time> us to complete...") to the list golden.
+    for line in f:
+        if line.startswith('#'):
+            if 'Golden run took' in line:
+                golden.append(int(line.split('took', 1)[1].split()[0], 10))
+            continue
+        p = line.split(',')
+        if len(p) != 3:
+            continue
+        try:
+            d = p[2].split()
+            if len(d) != 2 or d[1] != 'us':
+                continue
+            yield int(p[0], 10), p[1].strip(), int(d[0], 10)
+        except ValueError:
+            continue
+
+
+def merge_reports(out, reports, previous=None):
+    # Concatenate the test reports (paths) into the text file out. The results of the stored report previous (e.g.
+    # before a rerun of some mutants) are kept, except those of the mutants the new reports contain again.
+    if previous is not None:
+        rerun = set()
+        for r in reports:
+            with open(r, 'r') as f:
+                rerun.update(p[0] for p in parse_test_report(f, []))
+        with open_artifact(previous) as f:
+            for line in f:
+                if not line.startswith('#'):
+                    i = line.split(',', 1)[0].strip()
+                    if i.isdigit() and int(i, 10) in rerun:
+                        continue
+                out.write(line)
+    for r in reports:
+        with open(r, 'r') as f:
+            shutil.copyfileobj(f, out)
+
+
+# Characters with a meaning in COPY's text format (column and row separators, escape)
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+class RowStream:
+    # File-like adapter that feeds rows to psycopg2's copy_expert() without buffering the whole report
+    def __init__(self, rows):
+        self.rows = rows
+        self.buf = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buf) < size:
+            r = next(self.rows, None)
+            if r is None:
+                break
+            self.buf += "{}\t{}\t{}\n".format(r[0], r[1].translate(COPY_ESCAPES), r[2])
+        if size < 0:
+            data, self.buf = self.buf, ''
+        else:
+            data, self.buf = self.buf[:size], self.buf[size:]
+        return data
+
+    readline = read
+
+
+def copy_results(ml, rows):
+    # PostgreSQL: stream all results into a temporary table (COPY) and apply them with a single UPDATE ... FROM
+    from django.db.backends.postgresql.psycopg_any import is_psycopg3
+    from .models import Mutant, Outcome
+
+    mutant_table = Mutant._meta.db_table
+    outcome_table = Outcome._meta.db_table
+    # Dropped explicitly below (not ON COMMIT), so that several lists can be ingested in one outer transaction
+    results_table = "mutant_results_{}".format(ml.pk)
+
+    with transaction.atomic(), connection.cursor() as c:
+        c.execute("CREATE TEMPORARY TABLE {r} (id bigint, result varchar(100), runtime bigint)".format(
+            r=results_table))
+        if is_psycopg3:
+            with c.cursor.copy("COPY {r} (id, result, runtime) FROM STDIN".format(r=results_table)) as copy:
+                for r in rows:
+                    copy.write_row(r)
+        else:
+            c.cursor.copy_expert("COPY {r} (id, result, runtime) FROM STDIN".format(r=results_table),
+                                 RowStream(iter(rows)))
+        c.execute("ANALYZE {r}".format(r=results_table))
+
+        # New result texts (a handful per report) get their codes one by one, Outcome.objects.code() resolves
+        # concurrent ingestions
+        c.execute("SELECT DISTINCT result FROM {r} r WHERE NOT EXISTS (SELECT 1 FROM {o} WHERE text = r.result)".format(
+            r=results_table, o=outcome_table))
+        for (text,) in c.fetchall():
+            Outcome.objects.code(text)
+
+        c.execute("UPDATE {m} SET outcome_id = o.id, runtime = r.runtime "
+                  "FROM {r} r JOIN {o} o ON o.text = r.result "
+                  "WHERE {m}.id = r.id AND {m}.parent_id = %s".format(m=mutant_table, r=results_table,
+                                                                     o=outcome_table), [ml.pk])
+        c.execute("DROP TABLE {r}".format(r=results_table))
+
+
+def copy_rows(model, fk, source, target):
+    # Copy all rows of model that belong to source (foreign key fk) to target with a single INSERT ... SELECT
+    # (coverage and mutants of programs with the same ELF, see Software.twin)
+    table = model._meta.db_table
+    columns = [f.column for f in model._meta.concrete_fields if not f.primary_key and f.name != fk]
+    fk_column = model._meta.get_field(fk).column
+    with connection.cursor() as c:
+        c.execute("INSERT INTO {t} ({fk}, {cols}) SELECT %s, {cols} FROM {t} WHERE {fk} = %s ORDER BY {pk}".format(
+            t=table, fk=fk_column, cols=", ".join(columns), pk=model._meta.pk.column), [target, source])
+        return c.rowcount
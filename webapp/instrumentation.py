@@ -0,0 +1,144 @@
+import functools
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+# Active stages of the current thread (outermost first)
+_local = threading.local()
+WRITES = ("INSERT", "UPDATE", "DELETE")
+
+
+class Stage:
+    # Resources used by one stage (or one category within a stage, see lap()) of the analysis of a program
+    def __init__(self, software, name, category=""):
+        self.software = software
+        self.name = name
+        self.category = category
+        self.queries = 0
+        self.rows = 0
+        self.current = None
+        self.started = timezone.now()
+        self.t0 = time.perf_counter()
+        self.c0 = os.times()
+        self.rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    def stop(self):
+        from .models import StageMetric
+        c = os.times()
+        return StageMetric(software_id=self.software.pk, stage=self.name, category=self.category,
+                           started=self.started, wall=time.perf_counter() - self.t0,
+                           cpu=(c.user - self.c0.user) + (c.system - self.c0.system),
+                           cpu_children=(c.children_user - self.c0.children_user) +
+                                        (c.children_system - self.c0.children_system),
+                           rss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - self.rss0,
+                           queries=self.queries, rows=self.rows)
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+        _local.records = []
+    return _local.stack
+
+
+def _count(execute, sql, params, many, context):
+    r = execute(sql, params, many, context)
+    rows = 0
+    if sql.lstrip()[:6].upper() in WRITES:
+        rows = max(0, context["cursor"].rowcount)
+    for s in _stack():
+        for x in (s, s.current):
+            if x is not None:
+                x.queries += 1
+                x.rows += rows
+    return r
+
+
+def lap(category):
+    # Start the next category of the innermost active stage (e.g. GPR, CSR, ... in MutantListManager.create)
+    stack = _stack()
+    if len(stack) == 0:
+        return
+    s = stack[-1]
+    if s.current is not None:
+        _local.records.append(s.current.stop())
+    s.current = Stage(s.software, s.name, category)
+
+
+@contextmanager
+def stage(software, name):
+    # Record wall/CPU time, growth of the peak RSS, queries and written rows of a stage as StageMetric of the
+    # software. Nested stages are recorded separately, everything is stored when the outermost stage ends.
+    stack = _stack()
+    s = Stage(software, name)
+    outermost = len(stack) == 0
+    stack.append(s)
+    try:
+        if outermost:
+            with connection.execute_wrapper(_count):
+                yield s
+        else:
+            yield s
+    finally:
+        stack.pop()
+        if s.current is not None:
+            _local.records.append(s.current.stop())
+        _local.records.append(s.stop())
+        if outermost:
+            records, _local.records = _local.records, []
+            save(records)
+
+
+def save(records):
+    from .models import StageMetric
+    try:
+        StageMetric.objects.bulk_create(records)
+    except DatabaseError as e:
+        print("WARNING: could not store stage metrics ({}).".format(e))
+
+
+def measure(name):
+    # Decorator: record a function call as stage of its first argument (Software or object with .software)
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(obj, *args, **kwargs):
+            with stage(getattr(obj, "software", obj), name):
+                return f(obj, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+FIELDS = ["wall", "cpu", "cpu_children", "rss", "queries", "rows"]
+PROMETHEUS = {
+    "wall": ("fearv_stage_wall_seconds", "Wall time of the stage"),
+    "cpu": ("fearv_stage_cpu_seconds", "CPU time of the analysis process"),
+    "cpu_children": ("fearv_stage_children_cpu_seconds", "CPU time of subprocesses (QEMU)"),
+    "rss": ("fearv_stage_peak_rss_growth_kibibytes", "Growth of the peak RSS of the analysis process during the stage"),
+    "queries": ("fearv_stage_queries", "Number of SQL queries"),
+    "rows": ("fearv_stage_rows_written", "Number of rows inserted, updated or deleted"),
+}
+
+
+def as_jsonl(metrics):
+    for m in metrics.select_related("software").order_by("pk").iterator():
+        d = {"software": m.software.name, "stage": m.stage, "category": m.category, "started": m.started.isoformat()}
+        d.update({f: getattr(m, f) for f in FIELDS})
+        yield json.dumps(d) + "\n"
+
+
+def as_prometheus(metrics):
+    # Latest measurement per program, stage and category
+    latest = {}
+    for m in metrics.select_related("software").order_by("pk").iterator():
+        latest[m.software.name, m.stage, m.category] = m
+    for f in FIELDS:
+        metric, text = PROMETHEUS[f]
+        yield "# HELP {} {}\n# TYPE {} gauge\n".format(metric, text, metric)
+        for (software, name, category), m in sorted(latest.items()):
+            yield '{}{{software="{}",stage="{}",category="{}"}} {}\n'.format(
+                metric, software.replace('\\', '\\\\').replace('"', '\\"'), name, category, getattr(m, f))
@@ -1,7 +1,10 @@
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.db.models import Q
-from .models import Architecture, Instruction, InstructionFault
+from django.views.decorators.http import condition
+from . import caching
+from .models import Architecture, Instruction, InstructionFault, MutantList, MutantListSummary, Outcome
 from math import comb
 
 THEME_COLORS = {
@@ -46,45 +49,95 @@ THEME_COLORS = {
 }
 
 
+def layout(arch_id, instruction_id):
+    # Bit layout of an instruction (see Instruction.bit_layout), cached until the architecture changes
+    def compute():
+        return Instruction.objects.get(pk=instruction_id).bit_layout()
+    return caching.cached(arch_id, "layout:{}".format(instruction_id), compute)
+
+
+def fault_target(instruction_id, fault_mask):
+    # (target id,) of the InstructionFault (target id None: illegal instruction), None if there is no such fault. One
+    # indexed query, not cached: an entry per (instruction, mask) would flood the cache, only the layouts are cached
+    return InstructionFault.objects.filter(source_id=instruction_id, error_mask=fault_mask).values_list(
+        'target_id').first()
+
+
+def encoding_etag(request, instruction_id, fault_mask=0):
+    i = caching.instruction(instruction_id)
+    return "{}-{}-{}".format(caching.version(i.subset.arch_id), i.id, int(fault_mask))
+
+
+@condition(etag_func=encoding_etag)
 def encoding(request, instruction_id, fault_mask=0):
-    i = get_object_or_404(Instruction, pk=instruction_id)
+    # The layout of the faulty instruction with the flipped bits selected, from the cached layouts (one query for the
+    # target of the fault, the browser revalidates with the ETag)
+    i = caching.instruction(instruction_id)
+    arch_id = i.subset.arch_id
     m = int(fault_mask)
-    if int(fault_mask) != 0:
-        f = get_object_or_404(InstructionFault, source=i, error_mask=m)
+    bits = layout(arch_id, i.id)
+    if m != 0:
+        t = fault_target(i.id, m)
+        if t is None:
+            raise Http404("No InstructionFault matches the given query.")
+        if t[0] is None:
+            bits = [["dontcare", "ILL"]] * i.bits
+        else:
+            bits = layout(arch_id, t[0])
+
     bit_text = []
     for b in range(i.bits):
-        bit = dict()
-        if m != 0:
-            i = f.target
-        if i is None:
-            bit["txt"] = "ILL"
-            bit["class"] = "dontcare"
-        elif i.mask & 1 << b:
-            bit["class"] = "opcode"
-            if i.opcode & 1 << b:
-                bit["txt"] = "1"
-            else:
-                bit["txt"] = "0"
-        else:
-            bit["class"] = "dontcare"
-            bit["txt"] = "X"
-            for o in i.operands.all():
-                if o.mask & 1 << b:
-                    # This is operand
-                    if o.optype == 'gpr' or o.optype == 'fpr' or o.optype == 'csr':
-                        bit["class"] = "register"
-                    else:
-                        bit["class"] = "immediate"
-                    bit["txt"] = o.shortname
-        if m != 0 and m & 1 << b:
-            bit["class"] += "_sel"
-        bit_text.append(bit)
-        
+        c, txt = bits[b] if b < len(bits) else ("dontcare", "X")
+        if m & 1 << b:
+            c += "_sel"
+        bit_text.append({"txt": txt, "class": c})
+
     result = dict()
     result['data'] = list(reversed(bit_text))
     return JsonResponse(result)
 
 
+def fault_effects_etag(request, instruction_id, distance=3):
+    i = caching.instruction(instruction_id)
+    return "{}-{}-d{}".format(caching.version(i.subset.arch_id), i.id, int(distance))
+
+
+@condition(etag_func=fault_effects_etag)
+def fault_effects(request, instruction_id, distance=3):
+    # Effects of all faults of an instruction with up to distance flipped bits, so that the bitflip page needs no
+    # request per selection. One query per instruction, cached until the architecture changes and filtered by distance
+    # afterwards (the distance in the URL does not add cache entries):
+    # - targets: {id: [name, url, [[shortname, optype, mask], ...]]}
+    # - faults: [[error mask, target id (None: illegal), effect_opcode, [indexes of the affected target operands]]]
+    i = caching.instruction(instruction_id)
+    distance = int(distance)
+
+    def compute():
+        faults = {}
+        targets = {}
+        for m, d, t, effect, name, op_name, op_type, op_mask in InstructionFault.objects.filter(
+                source_id=i.id).values_list(
+                'error_mask', 'distance', 'target_id', 'effect_opcode', 'target__name', 'target__operands__shortname',
+                'target__operands__optype', 'target__operands__mask').order_by('error_mask', 'target__operands'):
+            faults[m] = [m, t, effect, [], d]
+            if t is None:
+                continue
+            if t not in targets:
+                targets[t] = [name, reverse('interactive', args=(t,)), []]
+            operands = targets[t][2]
+            if op_name is not None and [op_name, op_type, op_mask] not in operands:
+                operands.append([op_name, op_type, op_mask])
+        for f in faults.values():
+            if f[1] is not None:
+                f[3] = [n for n, o in enumerate(targets[f[1]][2]) if o[2] & f[0]]
+        return {'targets': targets, 'faults': list(faults.values())}
+
+    effects = caching.cached(i.subset.arch_id, "fault_effects:{}".format(i.id), compute)
+    faults = [f[:4] for f in effects['faults'] if f[4] <= distance]
+    targets = {t: effects['targets'][t] for t in set(f[1] for f in faults if f[1] is not None)}
+    return JsonResponse({'instruction': i.id, 'distance': distance, 'targets': targets, 'faults': faults})
+
+
 def testrelevance(request, arch_id, bits):
     a = get_object_or_404(Architecture, pk=arch_id)
     
@@ -234,3 +287,31 @@ def chartdata(request, instruction_id, distance):
     result['total'] = comb(i.bits, distance)
     
     return JsonResponse(result)
+
+
+def mutantlist(request, mutantlist_id):
+    ml = get_object_or_404(MutantList, pk=mutantlist_id)
+    try:
+        limit = min(int(request.GET.get('limit', 500)), 10000)
+        mutants = ml.results().search(request.GET.get('kind'), request.GET.get('outcome'), request.GET.get('address'))
+        rows, next_after = mutants.page(int(request.GET.get('after', 0)), limit)
+    except ValueError:
+        return JsonResponse({'error': "Invalid filter value."}, status=400)
+
+    result = dict()
+    result['fields'] = ['id', 'kind', 'nr_or_address', 'access_idx', 'bitflip', 'detected_error', 'runtime']
+    result['data'] = [r[:5] + (Outcome.objects.text(r[5]), r[6]) for r in rows]
+    result['next'] = next_after
+    return JsonResponse(result)
+
+
+def mutantlist_summary(request, mutantlist_id):
+    summary = get_object_or_404(MutantListSummary, mutantlist_id=mutantlist_id)
+
+    result = dict()
+    result['counts'] = summary.counts
+    result['addresses'] = summary.addresses
+    result['address_bucket'] = MutantListSummary.ADDRESS_BUCKET
+    result['runtimes'] = summary.runtimes
+    result['updated'] = summary.updated
+    return JsonResponse(result)
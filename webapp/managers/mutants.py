@@ -1,6 +1,8 @@
-from django.db import models
+import random
+from django.db import IntegrityError, models, transaction
 from tools.GoldenRunParser import GoldenRunParser
-from webapp.models.hardware import InstructionFault, exp_bit_faults
+from webapp.instrumentation import lap, stage
+from webapp.models.hardware import Instruction, InstructionFault, exp_bit_faults
 
 
 def do_bulk_insert(items):
@@ -10,12 +12,77 @@ def do_bulk_insert(items):
     items.clear()
 
 
+def fault_models(instance, flip, sa_0, sa_1):
+    # (kind, stuck-at value) of all enabled permanent fault models. The stuck-at value is None for bit-flips.
+    r = []
+    if instance.with_flip_faults:
+        r.append((flip, None))
+    if instance.with_stuckat_faults:
+        r.extend([(sa_0, 0), (sa_1, 1)])
+    return r
+
+
+def changed_bits(word, bitflip, stuck):
+    # Bits of 'word' that are actually inverted by a bit-flip (stuck is None) or stuck-at fault.
+    if stuck is None:
+        return bitflip
+    if stuck == 0:
+        return bitflip & word
+    return bitflip & ~word
+
+
+def is_illegal(ifaults, insn, word, bitflip, stuck):
+    f = ifaults.get((insn.pk, changed_bits(word, bitflip, stuck)))
+    return f is not None and f[1]
+
+
+def collapse(mutant, bitflip):
+    # Stuck-at mutant that is equivalent to the representative with the given bitflip at the same site (see
+    # MutantList.expand_equivalent). It is never simulated itself.
+    mutant.prediction = mutant.Prediction.EQUIVALENT
+    mutant.equivalent_to = bitflip
+    mutant.simulate = False
+    return 1
+
+
+def predict(instance, mutant, prediction, confident=True):
+    # Pre-classify the mutant with a predicted outcome. Unless it is drawn into the validation sample, it will not
+    # be simulated. Its outcome stays "?" until it is simulated, killed()/notkilled() count it with the prediction.
+    # Predictions that are not confident (e.g. an illegal instruction that is never executed) are always simulated and
+    # never counted. Returns the number of skipped simulations (0 or 1).
+    mutant.prediction = prediction
+    mutant.confident = confident
+    mutant.simulate = not confident or random.random() < instance.validation_rate
+    return 0 if mutant.simulate else 1
+
+
 class MutantListManager(models.Manager):
-    def create(self, **kwargs):
-        from webapp.models.mutation import Mutant
+    def create(self, reuse=True, **kwargs):
         instance = super().create(**kwargs)
+        with stage(instance.software, "mutants"):
+            source = self.reusable(instance) if reuse else None
+            if source is not None:
+                # Same ELF and options: same mutants and outcomes (see Software.twin)
+                lap("link")
+                instance.link_results(source)
+            else:
+                self.generate(instance)
+        return instance
+
+    def reusable(self, instance):
+        # Simulated mutant list of a program with the same ELF and the same options
+        twin = instance.software.twin()
+        if twin is None:
+            return None
+        return self.filter(software__arch_id=twin.arch_id, software__digest=twin.digest, summary__isnull=False,
+                           **{f: getattr(instance, f) for f in instance.OPTIONS}).exclude(
+            pk=instance.pk).order_by('pk').first()
+
+    def generate(self, instance):
+        from webapp.models.mutation import Mutant
 
         # Generate Mutants:
+        lap("parse")
         dp = GoldenRunParser(instance.software.arch, instance.software.lst.path)
         pk = instance.pk
 
@@ -23,6 +90,7 @@ class MutantListManager(models.Manager):
         skipped = 0
 
         # 1) GPR
+        lap("GPR")
         if instance.with_gpr:
             all_gpr = {
                 cov[0]: (cov[1], cov[2], cov[3]) for cov in instance.software.gprcoverage.all()
@@ -52,18 +120,15 @@ class MutantListManager(models.Manager):
                         # Create faults for experiment set...
                         for c in range(1, all_gpr[idx][2] + 1):
                             for e in experiments_gpr[idx]:
-                                # if (idx, c) in dp.filter_gprs:
-                                #     base = dp.filter_gprs[(idx, c)][0]
-                                #     offset = dp.filter_gprs[(idx, c)][1]
-                                #     faulty_address = (base ^ c) + offset
-                                #     if faulty_address < dp.min or faulty_address > dp.max:
-                                #         skipped += 1
-                                #         continue
-                                items.append(Mutant(parent_id=pk, kind=Mutant.Kind.GPR_TRANSIENT_FLIP, access_idx=c,
-                                                    nr_or_address=idx, bitflip=e))
+                                m = Mutant(parent_id=pk, kind=Mutant.Kind.GPR_TRANSIENT_FLIP, access_idx=c,
+                                           nr_or_address=idx, bitflip=e)
+                                if instance.with_address_pruning and dp.is_address_fault(idx, c, e):
+                                    skipped += predict(instance, m, Mutant.Prediction.ADDRESS_FAULT)
+                                items.append(m)
                         do_bulk_insert(items)
 
         # 2) CSR
+        lap("CSR")
         if instance.with_csr:
             all_csr = {
                 cov[0]: (cov[1], cov[2], cov[3]) for cov in instance.software.csrcoverage.all()
@@ -103,39 +168,72 @@ class MutantListManager(models.Manager):
                                                     nr_or_address=csr, bitflip=e))
                         do_bulk_insert(items)
 
+        if instance.with_imem or instance.with_ifr:
+            lap("IMEM/IFR prefetch")
+            insn_faults = dp.get_instruction_faults()
+            pc2exe = dp.get_pc_executions()
+            # Prefetch mapping: (instr_id, experiment) -> (ifault_id, illegal). Faults without target instruction
+            # decode to an undefined instruction as well (see ajax.fault_effect).
+            ifaults = dict()
+            for i, e, f, x, t in InstructionFault.objects.values_list('source_id', 'error_mask', 'id',
+                                                                      'effect_opcode', 'target_id').iterator():
+                ifaults[i, e] = (f, x == 'illegal' or t is None)
+
         if instance.with_imem:
+            lap("IMEM")
             experiments_imem = instance.software.arch.instruction_faults()
-            # Prefetch mapping: (instr_id, experiment) -> ifault_id
-            ifaults = dict()
-            for i, e, f in InstructionFault.objects.values_list('source_id', 'error_mask', 'id').iterator():
-                ifaults[i, e] = f
-            for (a, i) in dp.get_instruction_faults():
+            imem_models = fault_models(instance, Mutant.Kind.IMEM_PERMANENT_FLIP, Mutant.Kind.IMEM_PERMANENT_SA_0,
+                                       Mutant.Kind.IMEM_PERMANENT_SA_1)
+            for (a, i) in insn_faults:
+                w = dp.pc2word[a]
                 for e in experiments_imem[i.pk]:
                     # ifault_pk = InstructionFault.objects.get(source_id=i.pk, error_mask=e).pk
-                    ifault_pk = ifaults[i.pk, e]
-                    if instance.with_flip_faults:
-                        items.append(
-                            Mutant(parent_id=pk, kind=Mutant.Kind.IMEM_PERMANENT_FLIP, nr_or_address=a, bitflip=e,
-                                   ifault_id=ifault_pk))
-                    if instance.with_stuckat_faults:
-                        items.append(
-                            Mutant(parent_id=pk, kind=Mutant.Kind.IMEM_PERMANENT_SA_0, nr_or_address=a, bitflip=e,
-                                   ifault_id=ifault_pk))
-                        items.append(
-                            Mutant(parent_id=pk, kind=Mutant.Kind.IMEM_PERMANENT_SA_1, nr_or_address=a, bitflip=e,
-                                   ifault_id=ifault_pk))
+                    ifault_pk = ifaults[i.pk, e][0]
+                    for kind, stuck in imem_models:
+                        m = Mutant(parent_id=pk, kind=kind, nr_or_address=a, bitflip=e, ifault_id=ifault_pk)
+                        c = changed_bits(w, e, stuck)
+                        # Stuck-at faults that do not change the instruction word are equivalent to no fault at all:
+                        if instance.with_fault_collapsing and c == 0:
+                            skipped += predict(instance, m, Mutant.Prediction.NO_EFFECT)
+                        # A permanently illegal instruction traps on its first execution (if it is executed at all).
+                        # Predicted before collapsing: the representative of an illegal stuck-at fault would be
+                        # predicted as well and never simulated, so expand_equivalent had no outcome to copy.
+                        elif instance.with_imem_prediction and is_illegal(ifaults, i, w, e, stuck):
+                            skipped += predict(instance, m, Mutant.Prediction.ILLEGAL_INSTRUCTION,
+                                               confident=pc2exe.get(a, 0) > 0)
+                        # The others are equivalent to the bit-flip of the changed bits (or to the stuck-at fault of
+                        # exactly these bits if bit-flips are disabled):
+                        elif instance.with_fault_collapsing and stuck is not None and \
+                                (instance.with_flip_faults or c != e):
+                            skipped += collapse(m, c)
+                        items.append(m)
                 do_bulk_insert(items)
 
         if instance.with_ifr:
+            lap("IFR")
+            # Executed instructions and the bits that are used by their encoding
+            used_bits = dict(Instruction.objects.filter(subset__arch=instance.software.arch).values_list('id', 'mask'))
+            for i, msk in Instruction.operands.through.objects.filter(
+                    instruction__subset__arch=instance.software.arch).values_list('instruction_id', 'operand__mask'):
+                used_bits[i] |= msk
+            executed = [(i, dp.pc2word[a], used_bits[i.pk] & ((1 << i.bits) - 1))
+                        for (a, i) in insn_faults if pc2exe.get(a, 0) > 0]
+
+            ifr_models = fault_models(instance, Mutant.Kind.IFR_PERMANENT_FLIP, Mutant.Kind.IFR_PERMANENT_SA_0,
+                                      Mutant.Kind.IFR_PERMANENT_SA_1)
             for e in exp_bit_faults(32, instance.software.arch.max_faults_ifr):
-                if instance.with_flip_faults:
-                    items.append(Mutant(parent_id=pk, kind=Mutant.Kind.IFR_PERMANENT_FLIP, nr_or_address=0, bitflip=e))
-                if instance.with_stuckat_faults:
-                    items.append(Mutant(parent_id=pk, kind=Mutant.Kind.IFR_PERMANENT_SA_0, nr_or_address=0, bitflip=e))
-                    items.append(Mutant(parent_id=pk, kind=Mutant.Kind.IFR_PERMANENT_SA_1, nr_or_address=0, bitflip=e))
+                for kind, stuck in ifr_models:
+                    m = Mutant(parent_id=pk, kind=kind, nr_or_address=0, bitflip=e)
+                    # The fault register corrupts every fetched instruction. If all executed instructions turn
+                    # illegal, the first fetch after the reset traps for certain:
+                    if instance.with_imem_prediction and len(executed) > 0 and \
+                            all(is_illegal(ifaults, i, w, e & msk, stuck) for i, w, msk in executed):
+                        skipped += predict(instance, m, Mutant.Prediction.ILLEGAL_INSTRUCTION)
+                    items.append(m)
             do_bulk_insert(items)
 
         if instance.with_coremem:
+            lap("COREMEM")
             # Get all memory locations involved in loads/stores
             coremem = set()
             m8, m16, m32 = dp.get_all_mem_accesses()
@@ -157,21 +255,93 @@ class MutantListManager(models.Manager):
                             Mutant(parent_id=pk, kind=Mutant.Kind.COREMEM_PERMANENT_SA_1, nr_or_address=loc, bitflip=e))
             do_bulk_insert(items)
 
+        dp.close()
         instance.skipped = skipped
 
+        # Sampling mode: only simulate a stratified random sample of all mutants without predicted outcome
+        if instance.sample_margin is not None:
+            lap("sampling")
+            instance.mutants.filter(prediction=Mutant.Prediction.NONE).update(simulate=False)
+            instance.draw_sample()
+
         instance.save()
-        return instance
+
+
+# Outcome codes with a fixed meaning ("?" means not simulated yet), all other codes are assigned on first use
+RESERVED_OUTCOMES = {"?": 0, "not killed": 1, "timeout": 2}
+
+# Mutants with a simulation result other than "not killed" or "timeout" (predictions are kept in Mutant.prediction)
+KILLED = ~models.Q(outcome__in=list(RESERVED_OUTCOMES.values()))
+
+
+class OutcomeManager(models.Manager):
+    _codes = {}
+    _texts = {v: k for k, v in RESERVED_OUTCOMES.items()}
+
+    def code(self, text):
+        if text not in self._codes:
+            o = self.filter(text=text).first()
+            while o is None:
+                pk = RESERVED_OUTCOMES.get(text)
+                if pk is None:
+                    pk = max(len(RESERVED_OUTCOMES), (self.aggregate(m=models.Max('id'))['m'] or 0) + 1)
+                try:
+                    with transaction.atomic():
+                        o = self.create(id=pk, text=text)
+                except IntegrityError:
+                    # Another process created the same text (found now) or took the code (retry with a new maximum)
+                    o = self.filter(text=text).first()
+            self._codes[text] = o.id
+            self._texts[o.id] = text
+        return self._codes[text]
+
+    def reserve(self):
+        # Create the outcomes with a fixed code (after migrate, see WebappConfig.ready)
+        for text, pk in RESERVED_OUTCOMES.items():
+            self.get_or_create(id=pk, defaults={'text': text})
+
+    def text(self, code):
+        if code not in self._texts:
+            self._texts[code] = self.get(pk=code).text
+            self._codes[self._texts[code]] = code
+        return self._texts[code]
 
 
 class MutantQuerySet(models.QuerySet):
+    # Mutants that are not simulated count with their prediction (see mutation.PREDICTED_KILLED), so that the summary,
+    # the estimates and fault_coverage agree
     def notkilled(self):
-        return self.filter(detected_error="not killed")
+        from webapp.models.mutation import PREDICTED_NOT_KILLED
+        return self.filter(PREDICTED_NOT_KILLED)
 
     def timeout(self):
-        return self.filter(detected_error="timeout")
+        return self.filter(outcome=RESERVED_OUTCOMES["timeout"])
 
     def killed(self):
-        return self.exclude(models.Q(detected_error="not killed") | models.Q(detected_error="timeout"))
+        from webapp.models.mutation import PREDICTED_KILLED
+        return self.filter(PREDICTED_KILLED)
+
+    def pending(self):
+        return self.filter(simulate=True, outcome=RESERVED_OUTCOMES["?"])
+
+    def search(self, kind=None, outcome=None, address=None):
+        # Filters of the mutant list view/export (empty values are ignored)
+        qs = self
+        if kind not in (None, ''):
+            qs = qs.filter(kind=int(kind))
+        if outcome not in (None, ''):
+            qs = qs.filter(outcome__text=outcome)
+        if address not in (None, ''):
+            qs = qs.filter(nr_or_address=int(address, 0))
+        return qs
+
+    def page(self, after=0, limit=500):
+        # Keyset pagination on the primary key: returns (rows, id to continue after or None)
+        rows = list(self.filter(id__gt=after).order_by('id').values_list(
+            'id', 'kind', 'nr_or_address', 'access_idx', 'bitflip', 'outcome', 'runtime')[:limit + 1])
+        if len(rows) > limit:
+            return rows[:limit], rows[limit - 1][0]
+        return rows, None
 
 
 class MutantManager(models.Manager):
@@ -186,3 +356,9 @@ class MutantManager(models.Manager):
 
     def killed(self):
         return self.get_queryset().killed()
+
+    def pending(self):
+        return self.get_queryset().pending()
+
+    def search(self, kind=None, outcome=None, address=None):
+        return self.get_queryset().search(kind, outcome, address)
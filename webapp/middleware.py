@@ -0,0 +1,155 @@
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (s) of the latency histogram buckets (plus one bucket for slower requests)
+LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+re_string = re.compile(r"'(?:[^']|'')*'")
+re_number = re.compile(r"\b\d+(?:\.\d+)?\b")
+re_list = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+re_space = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    # SQL with literals and parameter lists replaced, so that the queries of a loop look the same
+    sql = re_number.sub("?", re_string.sub("?", sql.replace("%s", "?")))
+    return re_space.sub(" ", re_list.sub("(...)", sql)).strip()
+
+
+def percentile(histogram, q):
+    # Upper bound of the latency bucket containing the q-quantile (None: slower than the last bucket)
+    n = sum(histogram)
+    c = 0
+    for i, h in enumerate(histogram):
+        c += h
+        if c >= q * n:
+            return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else None
+    return None
+
+
+class ViewStats:
+    def __init__(self):
+        self.requests = 0
+        self.time = 0.0
+        self.max_time = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.slow = 0
+        self.over_budget = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        # fingerprint -> most executions within a single request
+        self.repeated = {}
+
+    def add(self, t, queries, repeated, slow, over_budget):
+        self.requests += 1
+        self.time += t
+        self.max_time = max(self.max_time, t)
+        self.queries += queries
+        self.max_queries = max(self.max_queries, queries)
+        self.slow += slow
+        self.over_budget += over_budget
+        self.histogram[next((i for i, b in enumerate(LATENCY_BUCKETS) if t <= b), len(LATENCY_BUCKETS))] += 1
+        for f, n in repeated.items():
+            self.repeated[f] = max(self.repeated.get(f, 0), n)
+
+    def merge(self, other):
+        self.requests += other.requests
+        self.time += other.time
+        self.max_time = max(self.max_time, other.max_time)
+        self.queries += other.queries
+        self.max_queries = max(self.max_queries, other.max_queries)
+        self.slow += other.slow
+        self.over_budget += other.over_budget
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+        for f, n in other.repeated.items():
+            self.repeated[f] = max(self.repeated.get(f, 0), n)
+
+
+# Per-view statistics of this process: {view name: ViewStats}. Every server process stores a snapshot in the cache
+# at most every settings.PERFORMANCE_FLUSH seconds (key "performance:<host>:<pid>", listed in PROCESSES_KEY), the
+# performance page merges the snapshots of all processes.
+STATS = {}
+STATS_LOCK = threading.Lock()
+PROCESS_KEY = "performance:{}:{}".format(socket.gethostname(), os.getpid())
+PROCESSES_KEY = "performance:processes"
+_flushed = [0.0]
+
+
+def flush():
+    # Store the statistics of this process in the cache
+    with STATS_LOCK:
+        snapshot = {view: s.__dict__.copy() for view, s in STATS.items()}
+        _flushed[0] = time.monotonic()
+    cache.set(PROCESS_KEY, snapshot, None)
+    processes = cache.get(PROCESSES_KEY) or set()
+    if PROCESS_KEY not in processes:
+        # A registration lost to a concurrent update is repeated with the next flush
+        cache.set(PROCESSES_KEY, processes | {PROCESS_KEY}, None)
+
+
+def all_stats():
+    # Statistics of all server processes: {view name: ViewStats}
+    flush()
+    stats = {}
+    for snapshot in cache.get_many(list(cache.get(PROCESSES_KEY) or [])).values():
+        for view, d in snapshot.items():
+            s = ViewStats()
+            s.__dict__.update(d)
+            stats.setdefault(view, ViewStats()).merge(s)
+    return stats
+
+
+class QueryBudgetMiddleware:
+    # Latency and query count of every request, aggregated per view (see STATS and the performance page). Requests
+    # that are slower than settings.SLOW_REQUEST seconds or need more than settings.QUERY_BUDGET queries are logged
+    # (logger webapp.middleware) with the queries that were repeated at least settings.N_PLUS_ONE times.
+    # NOTE: Queries of streaming responses run after the view has returned and are not counted.
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.budget = getattr(settings, "QUERY_BUDGET", 100)
+        self.slow = getattr(settings, "SLOW_REQUEST", 1.0)
+        self.n_plus_one = getattr(settings, "N_PLUS_ONE", 10)
+        self.flush = getattr(settings, "PERFORMANCE_FLUSH", 10.0)
+
+    def __call__(self, request):
+        executed = {}
+
+        def count(execute, sql, params, many, context):
+            executed[sql] = executed.get(sql, 0) + 1
+            return execute(sql, params, many, context)
+
+        t = time.perf_counter()
+        with connection.execute_wrapper(count):
+            response = self.get_response(request)
+        t = time.perf_counter() - t
+
+        queries = sum(executed.values())
+        repeated = {}
+        for sql, n in executed.items():
+            f = fingerprint(sql)
+            repeated[f] = repeated.get(f, 0) + n
+        repeated = {f: n for f, n in repeated.items() if n >= self.n_plus_one}
+        slow = t > self.slow
+        over_budget = queries > self.budget
+
+        match = request.resolver_match
+        view = match.view_name if match is not None else "(unresolved)"
+        with STATS_LOCK:
+            STATS.setdefault(view, ViewStats()).add(t, queries, repeated, slow, over_budget)
+        if time.monotonic() - _flushed[0] > self.flush:
+            flush()
+
+        if slow or over_budget:
+            logger.warning("%s %s took %.3f s with %d queries.", request.method, request.path, t, queries)
+            for f, n in sorted(repeated.items(), key=lambda x: x[1], reverse=True)[:3]:
+                logger.warning("%dx (N+1?) %s", n, f[:200])
+        return response
@@ -1,6 +1,11 @@
+import hashlib
 import itertools
+import os
 import yaml
+from array import array
+from django.core.cache import cache
 from django.db import models
+from ..caching import cached
 from ..managers.hardware import ArchitectureManager, DeviceManager, DeviceCsrManager, MemoryRegionManager, \
     RegisterManager
 
@@ -17,6 +22,49 @@ def exp_bit_faults(bits, limit=1):
     return exp
 
 
+# Fault maps from Cell-Layout-Analysis (CLA) files, parsed once per file version:
+# {path: ((mtime, size), {"gprs"/"csrs": {number: (masks, number of bits of each mask)}})}
+_cla_maps = {}
+# Faults per limit: {(path, (mtime, size), kind, limit): {number: masks}}
+_cla_faults = {}
+CLA_KEYS = {"gprs": 10, "csrs": 16}
+
+
+def _load_cla(path):
+    st = os.stat(path)
+    version = (st.st_mtime_ns, st.st_size)
+    if path in _cla_maps and _cla_maps[path][0] == version:
+        return version, _cla_maps[path][1]
+
+    # The parsed map is kept in the cache (see settings.CACHES), other processes (e.g. parallel analyses) reuse it
+    key = "cla:{}:{}:{}".format(hashlib.sha1(path.encode()).hexdigest(), *version)
+    data = cache.get(key)
+    if data is None:
+        with open(path, "r") as f:
+            extra = yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+        data = {}
+        for kind, base in CLA_KEYS.items():
+            data[kind] = {}
+            for k, v in extra.get(kind, {}).items():
+                data[kind][int(k, base)] = (array("Q", v), array("B", [bin(x).count('1') for x in v]))
+        cache.set(key, data, None)
+
+    _cla_maps[path] = (version, data)
+    for key in [key for key in _cla_faults if key[0] == path]:
+        del _cla_faults[key]
+    return version, data
+
+
+def cla_faults(path, kind, limit):
+    # Faults of the "gprs" or "csrs" of a CLA file with at most limit flipped bits: {number: masks}
+    version, data = _load_cla(path)
+    key = (path, version, kind, limit)
+    if key not in _cla_faults:
+        _cla_faults[key] = {k: tuple(x for x, n in zip(masks, bits) if n <= limit)
+                            for k, (masks, bits) in data[kind].items()}
+    return dict(_cla_faults[key])
+
+
 class NamedItem(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
@@ -128,6 +176,21 @@ class Instruction(NamedItem):
     fmt = models.CharField(max_length=50, choices=INSTRUCTION_FORMAT_CHOICES, default="__UNDEFINED___")
     operands = models.ManyToManyField("Operand", blank=True)
 
+    def bit_layout(self):
+        # [class, text] of every bit (LSB first) as shown by the encoding view, see json.encoding
+        operands = list(self.operands.all())
+        layout = []
+        for b in range(self.bits):
+            if self.mask & 1 << b:
+                layout.append(["opcode", "1" if self.opcode & 1 << b else "0"])
+                continue
+            bit = ["dontcare", "X"]
+            for o in operands:
+                if o.mask & 1 << b:
+                    bit = ["register" if o.optype in ('gpr', 'fpr', 'csr') else "immediate", o.shortname]
+            layout.append(bit)
+        return layout
+
     class Meta(NamedItem.Meta):
         unique_together = ("subset", "opcode")
         index_together = [
@@ -208,6 +271,75 @@ class MemoryRegion(NamedItem):
         ]
 
 
+class AddressMap:
+    # Address ranges of the memory regions and memory-mapped CSRs of an architecture, sorted by start address, so that
+    # the addresses of COREMEM mutants are classified in one pass over the sorted addresses instead of a query each
+    def __init__(self, regions, csrs):
+        # regions: [(addr_from, addr_to, "mcore"/"mdevice", pk)], csrs: [(addr_from, addr_to, "mcsr", pk)]
+        self.regions = self.disjoint(regions)
+        self.csrs = self.disjoint(csrs)
+
+    @staticmethod
+    def disjoint(ranges):
+        # Split overlapping ranges (e.g. a device region within the whole address space), the smallest range wins
+        bounds = sorted(set([r[0] for r in ranges] + [r[1] + 1 for r in ranges]))
+        r = []
+        for a, b in zip(bounds, bounds[1:]):
+            inner = min((x for x in ranges if x[0] <= a and b - 1 <= x[1]), key=lambda x: x[1] - x[0], default=None)
+            if inner is not None:
+                r.append((a, b - 1) + inner[2:])
+        return r
+
+    @classmethod
+    def build(cls, arch_id):
+        regions = [(a, b, "mcore" if device is None else "mdevice", pk) for pk, a, b, device in
+                   MemoryRegion.objects.filter(arch_id=arch_id).values_list("pk", "addr_from", "addr_to", "device_id")]
+        csrs = [(n, n + max(1, bits // 8) - 1, "mcsr", pk) for pk, n, bits in
+                DeviceCsr.objects.filter(device__arch_id=arch_id).values_list("pk", "number", "bits")]
+        return cls(regions, csrs)
+
+    @classmethod
+    def of(cls, arch_id):
+        # Cached until the architecture changes
+        return cached(arch_id, "address_map", lambda: cls.build(arch_id))
+
+    @staticmethod
+    def _find(ranges, addresses):
+        # Merge the sorted addresses with the sorted (disjoint) ranges
+        r = {}
+        i = 0
+        n = len(ranges)
+        for a in addresses:
+            while i < n and ranges[i][1] < a:
+                i += 1
+            if i == n:
+                break
+            if ranges[i][0] <= a:
+                r[a] = ranges[i]
+        return r
+
+    def classify(self, addresses):
+        # {address: (region, csr)} with the ranges containing the addresses (None if there is none)
+        addresses = sorted(set(addresses))
+        regions = self._find(self.regions, addresses)
+        csrs = self._find(self.csrs, addresses)
+        return {a: (regions.get(a), csrs.get(a)) for a in addresses}
+
+    def fault_items(self, faults):
+        # Fault items (see Architecture.all_faults) of byte faults [(address, bitflip)]. A fault in a memory-mapped CSR
+        # is an item of the CSR (bitflip shifted to its byte) as well as of its memory region.
+        faults = list(faults)
+        classes = self.classify(a for a, bit in faults)
+        items = []
+        for a, bit in faults:
+            region, csr = classes[a]
+            if region is not None:
+                items.append("{},{},0x{:08x},0x{:08x}".format(region[2], region[3], a, bit))
+            if csr is not None:
+                items.append("mcsr,{},0x{:08x}".format(csr[3], bit << 8 * (a - csr[0])))
+        return items
+
+
 class Architecture(NamedItem):
     gcc_march = models.CharField(max_length=40)
     gcc_mabi = models.CharField(max_length=40)
@@ -234,8 +366,7 @@ class Architecture(NamedItem):
 
         # Do we have information from Cell-Layout-Analysis (CLA)?
         if self.extra_faults_from_cla is not None:
-            _extra = yaml.load(open(self.extra_faults_from_cla, 'r'), Loader=yaml.Loader)
-            return {int(k, 10): [x for x in v if bin(x).count('1') <= limit] for k, v in _extra['gprs'].items()}
+            return cla_faults(self.extra_faults_from_cla, "gprs", limit)
 
         # Fallback to naive calculation
         return {k: exp_bit_faults(32, limit=limit) for k in range(1, 32)}
@@ -246,8 +377,7 @@ class Architecture(NamedItem):
 
         # Do we have information from Cell-Layout-Analysis (CLA)?
         if self.extra_faults_from_cla is not None:
-            _extra = yaml.load(open(self.extra_faults_from_cla, 'r'), Loader=yaml.Loader)
-            return {int(k, 16): [x for x in v if bin(x).count('1') <= limit] for k, v in _extra['csrs'].items()}
+            return cla_faults(self.extra_faults_from_cla, "csrs", limit)
 
         # Fallback to naive calculation
         r = {}
@@ -345,12 +475,15 @@ class Architecture(NamedItem):
             items.extend(["mcsr,{},0x{:08x}".format(k, f) for f in v])
         for k, v in self.instruction_faults(limit).items():
             items.extend(["i,{},0x{:08x}".format(k, f) for f in v])
-        for k, v in self.memory_faults(limit).items():
-            items.extend(["mcore,0x{:08x},0x{:08x}".format(k[0], k[1], f) for f in v])
+        for k, v in self.memory_faults(limit=limit).items():
+            items.extend(["mcore,{},0x{:08x},0x{:08x}".format(k[0], k[1], f) for f in v])
         for k, v in self.memory_faults(device_memory=True, limit=limit).items():
-            items.extend(["mdevice,0x{:08x},0x{:08x}".format(k[0], k[1], f) for f in v])
+            items.extend(["mdevice,{},0x{:08x},0x{:08x}".format(k[0], k[1], f) for f in v])
         return items
 
+    def address_map(self):
+        return AddressMap.of(self.pk)
+
     def uncovered_faults(self, limit=None):
         from .mutation import MutantList
         f_return = set(self.all_faults(limit))
@@ -363,7 +496,7 @@ class Architecture(NamedItem):
         mcsr_ids = set()
 
         for f in f_return:
-            tpe, pk, flt = f.split(',')
+            tpe, pk = f.split(',')[:2]
             if tpe == "g":
                 gpr_numbers.add(pk)
             elif tpe == "c":
@@ -373,8 +506,7 @@ class Architecture(NamedItem):
             elif tpe == "mcsr":
                 mcsr_ids.add(pk)
             elif tpe == "mcore" or tpe == "mdevice":
-                # print("WARNING: Architecture.uncovered_faults(...)\n"
-                #       "mcore and mdevice not yet supported, skipping!")
+                # Memory faults are returned in f_return only
                 pass
             else:
                 raise Exception("Should not get here!")
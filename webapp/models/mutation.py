@@ -1,11 +1,18 @@
+import functools
+import math
 import os
-import re
 import tempfile
-from subprocess import run, DEVNULL
-from django.core.files import File
-from django.db import models
-from . import InstructionFault
-from ..managers.mutants import MutantListManager, MutantManager
+from contextlib import ExitStack
+from django.db import connection, models
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Subquery, Value, When
+from . import AddressMap, InstructionFault
+from ..artifacts import open_artifact, store
+from ..ingest import copy_results, merge_reports, parse_test_report
+from ..instrumentation import lap, measure
+from ..managers.mutants import KILLED, RESERVED_OUTCOMES, MutantListManager, MutantManager, OutcomeManager
+from ..sampling import allocate, draw, sample_size, stratified, wilson
+from ..simulation import TIMEOUT_FACTOR, TIMEOUT_OFFSET, qemu_executable, run_supervised, shard_mutants, site_of, \
+    timeout_budget
 
 
 class Mutant(models.Model):
@@ -33,35 +40,86 @@ class Mutant(models.Model):
         COREMEM_PERMANENT_SA_0 = 80
         COREMEM_PERMANENT_SA_1 = 81
 
-    parent = models.ForeignKey("MutantList", related_name="mutants", on_delete=models.CASCADE)
+    class Prediction(models.IntegerChoices):
+        NONE = 0, '?'
+        ADDRESS_FAULT = 1, 'predicted: load/store address fault'
+        ILLEGAL_INSTRUCTION = 2, 'predicted: illegal instruction'
+        NO_EFFECT = 3, 'predicted: not killed'
+        EQUIVALENT = 4, '?'
+
+    parent = models.ForeignKey("MutantList", related_name="mutants", on_delete=models.CASCADE, db_index=False)
     # kind = models.CharField(max_length=25, choices=MUTANT_KIND_CHOICES)
-    kind = models.IntegerField(choices=Kind.choices)
+    kind = models.PositiveSmallIntegerField(choices=Kind.choices)
     bitflip = models.PositiveBigIntegerField()
     nr_or_address = models.PositiveBigIntegerField()
-    access_idx = models.PositiveBigIntegerField(default=0)
+    access_idx = models.PositiveIntegerField(default=0)
     ifault = models.ForeignKey(InstructionFault, null=True, blank=True, on_delete=models.CASCADE)
 
-    detected_error = models.CharField(max_length=100, default="?")
+    outcome = models.ForeignKey("Outcome", related_name="+", default=RESERVED_OUTCOMES["?"], on_delete=models.PROTECT,
+                                db_constraint=False, db_index=False)
     runtime = models.BigIntegerField(default=0)
 
+    # Pre-classification (see MutantListManager.create): predicted mutants are only simulated for validation, their
+    # outcome stays "?" until then
+    prediction = models.PositiveSmallIntegerField(choices=Prediction.choices, default=Prediction.NONE)
+    confident = models.BooleanField(default=True)
+    equivalent_to = models.PositiveBigIntegerField(null=True, blank=True)
+    simulate = models.BooleanField(default=True)
+
     objects = MutantManager()
 
-    # Zu Indizes:
-    # - ["parent_id", "runtime"],# TBD: Wichtig? Auf jeden Fall fuer FSIM Resultate Export
-    # - ["parent_id", "detected_error"],# TBD: Wichtig? Auf jeden Fall fuer FSIM Resultate Export
+    @property
+    def detected_error(self):
+        return Outcome.objects.text(self.outcome_id)
+
+    @detected_error.setter
+    def detected_error(self, value):
+        self.outcome_id = Outcome.objects.code(value)
 
+    # Indexes (all queries are restricted to one MutantList):
+    # - [parent, kind, nr_or_address]: run_tests, sampling strata, expansion of equivalent mutants
+    # - [parent, outcome, kind]: killed()/notkilled()/timeout(), fault_coverage
+    # Results are written by primary key only.
     class Meta:
-        index_together = [
-            ["kind"],
-            ["kind", "bitflip", "detected_error"],
-            ["kind", "ifault", "bitflip", "detected_error"],
-            ["parent", "kind"],
-            ["parent", "detected_error", "nr_or_address"],
-            ["parent", "kind", "bitflip", "detected_error"],
-            ["parent", "kind", "ifault", "bitflip", "detected_error"],
+        indexes = [
+            models.Index(fields=["parent", "kind", "nr_or_address"]),
+            models.Index(fields=["parent", "outcome", "kind"]),
         ]
 
 
+class Outcome(models.Model):
+    # Lookup table for the results reported by QEMU (filled during MutantList.read_results)
+    UNKNOWN = RESERVED_OUTCOMES["?"]
+    NOT_KILLED = RESERVED_OUTCOMES["not killed"]
+    TIMEOUT = RESERVED_OUTCOMES["timeout"]
+
+    id = models.PositiveSmallIntegerField(primary_key=True)
+    text = models.CharField(max_length=100, unique=True)
+
+    objects = OutcomeManager()
+
+    def __str__(self):
+        return self.text
+
+
+# Predictions of an outcome (mutants without simulation result are counted with confident predictions in the summary,
+# the estimates and killed()/notkilled(), e.g. for fault_coverage)
+PREDICTED = [Mutant.Prediction.ADDRESS_FAULT, Mutant.Prediction.ILLEGAL_INSTRUCTION, Mutant.Prediction.NO_EFFECT]
+PREDICTED_KILLED = Q(outcome=Outcome.UNKNOWN, confident=True, prediction__in=[
+    Mutant.Prediction.ADDRESS_FAULT, Mutant.Prediction.ILLEGAL_INSTRUCTION]) | KILLED
+PREDICTED_NOT_KILLED = Q(outcome=Outcome.UNKNOWN, confident=True, prediction=Mutant.Prediction.NO_EFFECT) | Q(
+    outcome=Outcome.NOT_KILLED)
+
+# Permanent fault models per fault location: (bit-flip, (stuck-at-0, stuck-at-1))
+EQUIVALENT_KINDS = [
+    (Mutant.Kind.GPR_PERMANENT_FLIP, (Mutant.Kind.GPR_PERMANENT_SA_0, Mutant.Kind.GPR_PERMANENT_SA_1)),
+    (Mutant.Kind.CSR_PERMANENT_FLIP, (Mutant.Kind.CSR_PERMANENT_SA_0, Mutant.Kind.CSR_PERMANENT_SA_1)),
+    (Mutant.Kind.IMEM_PERMANENT_FLIP, (Mutant.Kind.IMEM_PERMANENT_SA_0, Mutant.Kind.IMEM_PERMANENT_SA_1)),
+    (Mutant.Kind.IFR_PERMANENT_FLIP, (Mutant.Kind.IFR_PERMANENT_SA_0, Mutant.Kind.IFR_PERMANENT_SA_1)),
+    (Mutant.Kind.COREMEM_PERMANENT_FLIP, (Mutant.Kind.COREMEM_PERMANENT_SA_0, Mutant.Kind.COREMEM_PERMANENT_SA_1)),
+]
+
+
 class MutantList(models.Model):
     software = models.OneToOneField("Software", related_name="mutantlist", on_delete=models.CASCADE, primary_key=True)
     skipped = models.PositiveIntegerField(default=0)
@@ -74,107 +132,381 @@ class MutantList(models.Model):
     with_flip_faults = models.BooleanField(default=True)
     with_stuckat_faults = models.BooleanField(default=True)
     with_transient_faults = models.BooleanField(default=False)
+    with_address_pruning = models.BooleanField(default=False)
+    with_imem_prediction = models.BooleanField(default=False)
+    with_fault_collapsing = models.BooleanField(default=False)
+    # Sampling mode (target margin of error of the kill rate, None: simulate all mutants)
+    sample_margin = models.FloatField(null=True, blank=True)
+    sample_confidence = models.FloatField(default=0.95)
+    sample_estimates = models.JSONField(null=True, blank=True)
+    validation_rate = models.FloatField(default=0.0)
     mutantlist = models.FileField(upload_to="mutants", null=True, blank=True)
     testresults = models.FileField(upload_to="results", null=True, blank=True)
+    # Linked to the simulated list of a program with the same ELF and options (see MutantListManager.create): the list
+    # has no mutants of its own, results() are those of copied_from. If copied_from is deleted, the first list linked
+    # to it takes over its mutants (see signals.mutantlist_deleting).
+    copied_from = models.ForeignKey("self", null=True, blank=True, related_name="+", on_delete=models.DO_NOTHING,
+                                    db_constraint=False)
 
     objects = MutantListManager()
 
-    def __str__(self):
-        return "MutantList[pk:{}, mutants.count:{}]".format(self.pk, self.mutants.count())
+    # Options that must match to reuse the mutants of another list
+    OPTIONS = ["with_gpr", "with_csr", "with_imem", "with_coremem", "with_ifr", "with_flip_faults",
+               "with_stuckat_faults", "with_transient_faults", "with_address_pruning", "with_imem_prediction",
+               "with_fault_collapsing", "sample_margin", "sample_confidence", "validation_rate"]
 
-    def run_tests(self, verbose=True):
+    def __str__(self):
+        return "MutantList[pk:{}, mutants.count:{}]".format(self.pk, self.results().count())
+
+    def results(self):
+        # Mutants with the outcomes of this list (those of copied_from for a linked list)
+        return Mutant.objects.filter(parent_id=self.copied_from_id or self.pk)
+
+    def qemu_command(self, mutant_file, results_file):
+        return qemu_executable() + [
+                "-M", self.software.arch.qemu_machine,
+                "-cpu", self.software.arch.qemu_cpu,
+                "-kernel", self.software.elf.path,
+                "-bios", "none", "-nographic", "-display", "none",
+                "-serial", "none",
+                "-device", "terminator,address=0x{:08X}".format(int(self.software.arch.qemu_terminator)),
+                "-test-setup", self.software.arch.qemu_testsetup,
+                "-mutant-list", mutant_file,
+                "-test-report", results_file,
+                ]
+
+    def link_results(self, source):
+        # Report the mutants and outcomes of source (a list with the same ELF and options) instead of simulating
+        self.copied_from_id = source.copied_from_id or source.pk
+        for f in ["skipped", "sample_estimates"]:
+            setattr(self, f, getattr(source, f))
+        self.save()
+        self.software.time = source.software.time
+        self.software.save(update_fields=["time"])
+        summary = source.summary
+        MutantListSummary.objects.create(mutantlist=self, counts=summary.counts, addresses=summary.addresses,
+                                         runtimes=summary.runtimes)
+
+    def detach(self):
+        # Give a linked list mutants of its own (copies with new ids, e.g. to simulate some of them again). The files
+        # of the other list refer to its mutant ids and are not taken over.
+        from ..ingest import copy_rows
+        if self.copied_from_id is None:
+            return
+        copy_rows(Mutant, "parent", self.copied_from_id, self.pk)
+        self.copied_from = None
+        self.mutantlist = None
+        self.testresults = None
+        self.save()
+
+    @measure("run_tests")
+    def run_tests(self, verbose=True, mutants=None, workers=1, timeout_factor=TIMEOUT_FACTOR,
+                  timeout_offset=TIMEOUT_OFFSET):
         skipped = self.skipped
-
-        with tempfile.NamedTemporaryFile(mode="w", delete=True, suffix=".mutants", buffering=20 * (1024 ** 2)) as temp:
-            # print("CREATED MUTANT LIST '{}'".format(temp.name))
-            # print("ELF FILE '{}'".format(self.software.elf.path))
-            # print("TEST-REPORT FILE '{}'".format(temp.name.replace(".mutants", ".testreport")))
-            mutant_file = temp.name
-
-            # 1) Create the mutant list and store it as temporary file...
-            temp.write("#id,kind,address/regnum,nracc,biterror\n")
-
-            for p in self.mutants.values_list('id', 'kind', 'nr_or_address', 'access_idx', 'bitflip').iterator():
-                temp.write("{},{},{},{},0x{:08X}\n".format(p[0], p[1], p[2], p[3], p[4]))
-
-            temp.write("# Done: created {} mutants (skipped: {}).\n".format(self.mutants.count(), skipped))
-            temp.flush()
-            self.mutantlist.save("{}_{}.mutants".format(self.pk, self.software.name), File(open(mutant_file, "r")))
+        previous = None
+        if mutants is None:
+            if self.copied_from_id is not None:
+                if verbose:
+                    print("Outcomes linked to MutantList {}, nothing to simulate.".format(self.copied_from_id))
+                return []
+            mutants = self.mutants.filter(simulate=True)
+        else:
+            # (mutants is evaluated below, after the linked mutants have been copied)
+            self.detach()
+            # Reruns of some mutants (rerun_timeouts, run_sampling) add their results to the stored test report
+            if self.testresults:
+                previous = self.testresults.path
+        workers = max(1, workers)
+
+        with tempfile.TemporaryDirectory() as tmp, ExitStack() as stack:
+            lap("write")
+            # 1) Create the mutant list and store it as temporary file (with workers > 1: plus one list per QEMU
+            #    process, all with about the same predicted runtime, see simulation.shard_mutants)...
+            mutant_file = os.path.join(tmp, "all.mutants")
+            temp = stack.enter_context(open(mutant_file, "w", buffering=20 * (1024 ** 2)))
+            shard_of = {}
+            shards = [temp]
+            if workers > 1:
+                shard_of, loads = shard_mutants(self, mutants, workers)
+                if verbose:
+                    print("Predicted runtime per QEMU process: {}".format(
+                        ", ".join("{:.1f} s".format(load / 1e6) for load in loads)))
+                shards = [stack.enter_context(open(os.path.join(tmp, "{}.mutants".format(s)), "w",
+                                                   buffering=4 * (1024 ** 2))) for s in range(workers)]
+            header = "#id,kind,address/regnum,nracc,biterror\n"
+            temp.write(header)
+            if workers > 1:
+                for f in shards:
+                    f.write(header)
+
+            for p in mutants.values_list('id', 'kind', 'nr_or_address', 'access_idx', 'bitflip').iterator():
+                line = "{},{},{},{},0x{:08X}\n".format(p[0], p[1], p[2], p[3], p[4])
+                temp.write(line)
+                if workers > 1:
+                    shards[shard_of.get((p[1], site_of(p[1], p[2], p[4]), p[3]), 0)].write(line)
+
+            temp.write("# Done: created {} mutants (skipped: {}).\n".format(mutants.count(), skipped))
+            for f in [temp] + shards:
+                f.close()
+            store(self.mutantlist, "{}_{}.mutants".format(self.pk, self.software.name), mutant_file)
             self.save()
 
-            # 2) Run QEMU simulation...
-            # print("BEGINNING QEMU SIMULATION...")
-            results_file = mutant_file.replace(".mutants", ".testreport")
-            cmd = ["qemu-system-riscv32",
-                   "-M", self.software.arch.qemu_machine,
-                   "-cpu", self.software.arch.qemu_cpu,
-                   "-kernel", self.software.elf.path,
-                   "-bios", "none", "-nographic", "-display", "none",
-                   "-serial", "none",
-                   "-device", "terminator,address=0x{:08X}".format(int(self.software.arch.qemu_terminator)),
-                   "-test-setup", self.software.arch.qemu_testsetup,
-                   # "-mutant-list", self.mutantlist.path,
-                   "-mutant-list", mutant_file,
-                   "-test-report", results_file,
-                   ]
-            # print("      CMD: {}".format(" ".join(cmd)))
-            # os.system("{} 1> /dev/null".format(" ".join(cmd)))
-            if verbose:
-                run(cmd, check=True, stdout=DEVNULL, stdin=DEVNULL, encoding="UTF-8")
+            lap("simulate")
+            # 2) Run QEMU simulation (one process per shard, see simulation.run_supervised), mutants that exceed the
+            #    timeout budget are killed...
+            if workers > 1:
+                shard_files = [os.path.join(tmp, "{}.mutants".format(s)) for s in range(workers)]
             else:
-                run(cmd, check=True, stdout=DEVNULL, stdin=DEVNULL, stderr=DEVNULL, encoding="UTF-8")
-            # run(cmd, check=True, encoding="UTF-8")
-
-            self.testresults.save("{}_{}.testreport".format(self.pk, self.software.name), File(open(results_file, 'r')))
+                shard_files = [mutant_file]
+            budget = None
+            if timeout_factor is not None:
+                # Calibrated with the golden run that QEMU reports first (Software.time may not be known yet)
+                budget = functools.partial(timeout_budget, factor=timeout_factor, offset=timeout_offset)
+            # qemu_command runs inside the event loop of run_supervised, where Django refuses queries: load the
+            # architecture of the software (cached on it) beforehand
+            self.software.arch.refresh_from_db()
+            reports, failures = run_supervised(self.qemu_command, shard_files, budget, verbose, workers)
+
+            lap("store")
+            # 3) ... and merge the test reports
+            results_file = os.path.join(tmp, "merged.testreport")
+            with open(results_file, "w") as out:
+                merge_reports(out, reports, previous)
+
+            store(self.testresults, "{}_{}.testreport".format(self.pk, self.software.name), results_file)
             self.save()
-            os.remove(results_file)
-
-            # print("\nDONE SIMULATING!")
 
+            # Mutant lists that could not be simulated completely (their remaining mutants stay pending)
+            return failures
+
+    def rerun_timeouts(self, timeout_factor=4 * TIMEOUT_FACTOR, timeout_offset=4 * TIMEOUT_OFFSET, verbose=True,
+                       workers=1):
+        # Simulate the mutants that timed out once more with a longer budget
+        self.detach()
+        mutants = self.mutants.timeout().filter(simulate=True)
+        n = mutants.count()
+        if n > 0:
+            self.run_tests(verbose, mutants, workers, timeout_factor, timeout_offset)
+            self.read_results()
+        return n
+
+    @measure("read_results")
+    def read_results(self):
+        if self.copied_from_id is not None:
+            # Linked list: the outcomes are those of the other list
             return
+        lap("ingest")
+        golden = []
+        with open_artifact(self.testresults.path) as f:
+            results = parse_test_report(f, golden)
+            if connection.vendor == 'postgresql':
+                copy_results(self, results)
+            else:
+                m_update = list()
+                for i, res, dur in results:
+                    m_update.append(Mutant(id=i, outcome_id=Outcome.objects.code(res), runtime=dur))
+                    if len(m_update) > 10000:
+                        Mutant.objects.bulk_update(m_update, ['outcome', 'runtime'], batch_size=2000)
+                        m_update = list()
+                Mutant.objects.bulk_update(m_update, ['outcome', 'runtime'], batch_size=2000)
+
+        if len(golden) > 0:
+            self.software.time = golden[0]
+            self.software.save()
+
+        lap("expand")
+        self.expand_equivalent()
+
+        if self.sample_margin is not None:
+            self.sample_estimates = self.kill_rate_estimates()
+            self.save()
 
-        # NOTE: Statements below are unreachable -> commented out...
-        # print("\n              ERROR while running MutantList.run_tests()")
-        # sys.exit(1)
+        lap("summarize")
+        self.summarize()
 
-    def read_results(self):
-        self.read_time()
-
-        regex = re.compile(r"\s*(?P<id>\d+),\s*(?P<result>[\w\-_: ]+),\s*(?P<duration>\d+) us")
-        with open(self.testresults.path, 'r') as f:
-            m_update = list()
-            # for l in f.readlines():
-            for line in f:
-                m = regex.match(line)
-                if m is not None:
-                    i = int(m.group('id').strip(), 10)
-                    res = m.group('result').strip()
-                    dur = int(m.group('duration').strip(), 10)
-                    m_update.append(Mutant(id=i, detected_error=res, runtime=dur))
-
-                if len(m_update) > 10000:
-                    Mutant.objects.bulk_update(m_update, ['detected_error', 'runtime'], batch_size=2000)
-                    m_update = list()
-
-            Mutant.objects.bulk_update(m_update, ['detected_error', 'runtime'], batch_size=2000)
-
-    def read_time(self):
-        regex = re.compile(r"#\s+Golden run took\s+(?P<time>\d+) us to complete...")
-        with open(self.testresults.path, 'r') as f:
-            for line in f:
-                m = regex.match(line)
-                if m is not None:
-                    time = int(m.group('time').strip(), 10)
-                    self.software.time = time
-                    self.software.save()
-                    return
+    def expand_equivalent(self):
+        # Copy the results of the representatives to all collapsed stuck-at mutants (see MutantListManager.create)
+        if not self.with_fault_collapsing:
+            return
+        kinds = set(self.mutants.filter(prediction=Mutant.Prediction.EQUIVALENT).values_list(
+            'kind', flat=True).distinct().order_by())
+        for flip, stuck_at in EQUIVALENT_KINDS:
+            for kind in stuck_at:
+                if kind not in kinds:
+                    continue
+                rep_kind = flip if self.with_flip_faults else kind
+                rep = self.mutants.filter(kind=rep_kind, nr_or_address=OuterRef('nr_or_address'),
+                                          access_idx=OuterRef('access_idx'), bitflip=OuterRef('equivalent_to'))
+                # Representatives without result (not sampled yet) or missing ones leave the mutant unchanged
+                rep = rep.exclude(outcome=Outcome.UNKNOWN)
+                self.mutants.filter(Exists(rep), kind=kind, prediction=Mutant.Prediction.EQUIVALENT).update(
+                    outcome=Subquery(rep.values('outcome')[:1]),
+                    runtime=Subquery(rep.values('runtime')[:1]))
+
+    def summarize(self):
+        # Outcome matrix of all mutants (one scan over the list), see MutantListSummary
+        mem_kinds = [k for k in Mutant.Kind if k.name.startswith(('IMEM', 'COREMEM'))]
+        address_bucket = Case(When(kind__in=mem_kinds, then=F('nr_or_address') / MutantListSummary.ADDRESS_BUCKET),
+                              default=F('nr_or_address'), output_field=models.BigIntegerField())
+        runtime_bucket = Case(*[When(runtime__lt=1 << b, then=Value(b)) for b in range(48)], default=Value(48),
+                              output_field=models.IntegerField())
+
+        counts = {}
+        addresses = {}
+        runtimes = {}
+        fields = ['kind', 'outcome', 'prediction', 'confident', 'a', 'r']
+        for kind, outcome, prediction, confident, a, r, n in self.mutants.annotate(
+                a=address_bucket, r=runtime_bucket).values(*fields).annotate(n=Count('id')).values_list(
+                *fields, 'n').order_by():
+            if outcome == Outcome.UNKNOWN and prediction in PREDICTED and confident:
+                # Not simulated: listed with the predicted outcome
+                text = Mutant.Prediction(prediction).label
+            else:
+                text = Outcome.objects.text(outcome)
+            counts.setdefault(str(kind), {})
+            counts[str(kind)][text] = counts[str(kind)].get(text, 0) + n
+            addresses[kind, text, a] = addresses.get((kind, text, a), 0) + n
+            runtimes.setdefault(str(kind), [0] * 49)
+            runtimes[str(kind)][r] += n
+
+        summary, created = MutantListSummary.objects.update_or_create(mutantlist=self, defaults={
+            'counts': counts,
+            'addresses': [[k, o, a, n] for (k, o, a), n in sorted(addresses.items())],
+            'runtimes': runtimes,
+        })
+        return summary
+
+    def strata(self):
+        # Mutants without predicted outcome per stratum (kind, site): {(kind, site): (population, sampled, done, killed)}
+        done = Q(simulate=True) & ~Q(outcome=Outcome.UNKNOWN)
+        r = {}
+        for s in self.results().filter(prediction=Mutant.Prediction.NONE).values('kind', 'nr_or_address').annotate(
+                N=Count('id'), n=Count('id', filter=Q(simulate=True)), d=Count('id', filter=done),
+                k=Count('id', filter=done & KILLED)).order_by():
+            r[s['kind'], s['nr_or_address']] = (s['N'], s['n'], s['d'], s['k'])
+        return r
+
+    def kill_rate_estimates(self, strata=None):
+        if strata is None:
+            strata = self.strata()
+        confidence = self.sample_confidence
+
+        # Mutants with predicted outcome are known exactly (sampled completely), a confident prediction counts until
+        # they are simulated (the others are sampled once simulated)
+        exact = {}
+        known = Q(confident=True) | ~Q(outcome=Outcome.UNKNOWN)
+        for kind, n, d, k in self.results().filter(prediction__in=PREDICTED).values('kind').annotate(
+                n=Count('id'), d=Count('id', filter=known), k=Count('id', filter=PREDICTED_KILLED)).values_list(
+                'kind', 'n', 'd', 'k').order_by():
+            exact[kind] = (n, d, k)
+
+        # Collapsed mutants share the outcome of their representative: one stratum per kind, sampled are those whose
+        # representative has been simulated (see expand_equivalent)
+        resolved = ~Q(outcome=Outcome.UNKNOWN)
+        equivalent = {}
+        for kind, n, d, k in self.results().filter(prediction=Mutant.Prediction.EQUIVALENT).values('kind').annotate(
+                n=Count('id'), d=Count('id', filter=resolved), k=Count('id', filter=resolved & KILLED)).values_list(
+                'kind', 'n', 'd', 'k').order_by():
+            equivalent[kind] = (n, d, k)
+
+        # Strata are collapsed per kind for the estimates (samples are allocated proportionally to all sites)
+        kinds = {}
+        for (kind, site), (N, n, d, k) in strata.items():
+            t = kinds.get(kind, (0, 0, 0))
+            kinds[kind] = (t[0] + N, t[1] + d, t[2] + k)
+
+        r = {'confidence': confidence, 'kinds': {}}
+        for kind in sorted(set(kinds) | set(exact) | set(equivalent)):
+            s = [x for x in (kinds.get(kind), exact.get(kind), equivalent.get(kind)) if x is not None]
+            rate, margin = stratified(s, confidence)
+            r['kinds'][Mutant.Kind(kind).label] = {
+                'population': sum(x[0] for x in s),
+                'sampled': sum(x[1] for x in s),
+                'rate': rate,
+                'margin': margin,
+            }
+        s = list(kinds.values()) + list(exact.values()) + list(equivalent.values())
+        rate, margin = stratified(s, confidence)
+        r['overall'] = {
+            'population': sum(x[0] for x in s),
+            'sampled': sum(x[1] for x in s),
+            'rate': rate,
+            'margin': margin,
+        }
+        return r
+
+    def stratum_estimates(self):
+        # Kill rate with Wilson confidence interval for every sampled stratum: {(kind, site): (sampled, rate, lo, hi)}
+        r = {}
+        for key, (N, n, d, k) in self.strata().items():
+            if d > 0:
+                r[key] = (d, k / d) + wilson(k, d, self.sample_confidence)
+        return r
+
+    def draw_sample(self, p=None):
+        # Add mutants to the sample until the target margin of error can be reached. The kill rate p of the
+        # mutants is estimated from the results so far (worst case 0.5 for the initial sample).
+        # Returns the number of new samples (0: target precision is reached).
+        strata = self.strata()
+        population = sum(s[0] for s in strata.values())
+        selected = sum(s[1] for s in strata.values())
+        done = sum(s[2] for s in strata.values())
+        if p is None:
+            p = (sum(s[3] for s in strata.values()) + 1.0) / (done + 2.0)
+
+        n = sample_size(population, self.sample_margin, self.sample_confidence, p)
+        n = max(0, n - selected)
+        if n == 0 and done > 0:
+            margin = self.kill_rate_estimates(strata)['overall']['margin']
+            if margin > self.sample_margin:
+                n = int(math.ceil(selected * ((margin / self.sample_margin) ** 2 - 1.0)))
+
+        quota = allocate(n, {k: s[0] - s[1] for k, s in strata.items()})
+        if len(quota) == 0:
+            return 0
+
+        pools = {k: [] for k in quota}
+        for pk, kind, site in self.mutants.filter(prediction=Mutant.Prediction.NONE, simulate=False).values_list(
+                'id', 'kind', 'nr_or_address').iterator():
+            if (kind, site) in pools:
+                pools[kind, site].append(pk)
+        ids = []
+        for k, n in quota.items():
+            ids.extend(draw(pools[k], n))
+        for c in range(0, len(ids), 10000):
+            self.mutants.filter(pk__in=ids[c:c + 10000]).update(simulate=True)
+        return len(ids)
+
+    def run_sampling(self, max_rounds=5, verbose=True):
+        # Adaptive sampling campaign: simulate the pending sample and top it up until the target precision is reached
+        self.detach()
+        for r in range(max_rounds):
+            # Sampled mutants and the validation sample of the predicted ones that have not been simulated yet
+            self.run_tests(verbose, mutants=self.mutants.filter(simulate=True, outcome=Outcome.UNKNOWN))
+            self.read_results()
+            if self.draw_sample() == 0:
+                break
+        return self.sample_estimates
+
+    def prediction_accuracy(self):
+        # Compare predicted outcomes with the simulation results of the validation sample:
+        # {prediction: (simulated, confirmed)}
+        r = {}
+        sampled = self.results().filter(simulate=True, prediction__in=PREDICTED).exclude(outcome=Outcome.UNKNOWN)
+        for p in sampled.values_list('prediction', flat=True).distinct():
+            if p == Mutant.Prediction.NO_EFFECT:
+                confirmed = sampled.filter(prediction=p).notkilled()
+            else:
+                confirmed = sampled.filter(prediction=p).killed()
+            r[Mutant.Prediction(p)] = (sampled.filter(prediction=p).count(), confirmed.count())
+        return r
 
     @property
     def fault_coverage(self):
         items = []
 
         # One line per GPR
-        all_gpr_mutants = self.mutants.killed().filter(kind__in=[
+        all_gpr_mutants = self.results().killed().filter(kind__in=[
                 Mutant.Kind.GPR_PERMANENT_FLIP,
                 Mutant.Kind.GPR_PERMANENT_SA_0,
                 Mutant.Kind.GPR_PERMANENT_SA_1,
@@ -184,7 +516,7 @@ class MutantList(models.Model):
             items.append("g,{},0x{:08x}".format(pk, bit))
 
         # One line per CSR
-        all_csr_mutants = self.mutants.killed().filter(kind__in=[
+        all_csr_mutants = self.results().killed().filter(kind__in=[
                 Mutant.Kind.CSR_PERMANENT_FLIP,
                 Mutant.Kind.CSR_PERMANENT_SA_0,
                 Mutant.Kind.CSR_PERMANENT_SA_1,
@@ -193,45 +525,17 @@ class MutantList(models.Model):
         for (pk, bit) in all_csr_mutants.values_list("nr_or_address", "bitflip").distinct():
             items.append("c,{},0x{:08x}".format(pk, bit))
 
-        #######################################################################
-        # ERR: | This does not work yet since it needs to                     #
-        # -----| output "mcore,<MCORE_ID>,<ADDR>,<BITERROR>" there is no      #
-        #      | fast method to decide whether this COREMEM mutant refers to  #
-        #      | a MMCSR, a CoreMemRegion or DeviceMemRegion.                 #
-        #      |------------------------------------------------------------- #
-        #      | TO-DO: Implement different Mutant types for all use cases.   #
-        #      |------------------------------------------------------------- #
-        #      | (Searching for <ADDR> in all MemoryRegion is possible but    #
-        #      |  probably extremely slow...)                                 #
-        #######################################################################
-
-        #######################################################################
-        # TO DO: One line per CoreMemoryRegion                                #
-        #######################################################################
-        # all_mem_mutants = self.mutants.killed().filter(kind__in=[
-        #         Mutant.Kind.COREMEM_PERMANENT_FLIP,
-        #         Mutant.Kind.COREMEM_PERMANENT_SA_0,
-        #         Mutant.Kind.COREMEM_PERMANENT_SA_1,
-        #         #Mutant.Kind.COREMEM_TRANSIENT_FLIP,
-        #     ])
-        #
-        # ------------------------------------------------------------------- #
-        #                                                                     #
-        # for (addr, bit) in all_mcore_mutants.values_list("nr_or_address", "bitflip").distinct():
-        #     items.append("mcore,0x{:08x},0x{:08x}".format(mcore_id, addr, bit))
-        #                                                                     #
-        #######################################################################
-
-        #######################################################################
-        # TO DO: One line per DeviceMemoryRegion                              #
-        #######################################################################
-
-        #######################################################################
-        # TO DO: One line per MMCSR                                           #
-        #######################################################################
+        # One line per memory location in a CoreMemoryRegion or DeviceMemoryRegion and per MMCSR (see AddressMap)
+        all_mem_mutants = self.results().killed().filter(kind__in=[
+                Mutant.Kind.COREMEM_PERMANENT_FLIP,
+                Mutant.Kind.COREMEM_PERMANENT_SA_0,
+                Mutant.Kind.COREMEM_PERMANENT_SA_1,
+            ])
+        items.extend(AddressMap.of(self.software.arch_id).fault_items(
+            all_mem_mutants.values_list("nr_or_address", "bitflip").distinct().iterator()))
 
         # IMEM
-        all_imem_mutants = self.mutants.killed().filter(kind__in=[
+        all_imem_mutants = self.results().killed().filter(kind__in=[
                 Mutant.Kind.IMEM_PERMANENT_FLIP,
                 Mutant.Kind.IMEM_PERMANENT_SA_0,
                 Mutant.Kind.IMEM_PERMANENT_SA_1,
@@ -241,3 +545,34 @@ class MutantList(models.Model):
             items.append("i,{},0x{:08x}".format(pk, bit))
 
         return frozenset(items)
+
+
+class MutantListSummary(models.Model):
+    # Precomputed results of a MutantList (updated at the end of MutantList.read_results):
+    # - counts: {kind: {outcome: count}}
+    # - addresses: [[kind, outcome, bucket, count]] with the register number or 4 KiB page (IMEM/COREMEM) as bucket
+    # - runtimes: {kind: [count per runtime bucket]} where bucket b holds runtimes in [2^(b-1), 2^b) us
+    ADDRESS_BUCKET = 4096
+
+    mutantlist = models.OneToOneField(MutantList, related_name="summary", on_delete=models.CASCADE, primary_key=True)
+    counts = models.JSONField(default=dict)
+    addresses = models.JSONField(default=list)
+    runtimes = models.JSONField(default=dict)
+    updated = models.DateTimeField(auto_now=True)
+
+    def count(self, kinds=None, outcome=None):
+        # e.g. count([Mutant.Kind.GPR_PERMANENT_SA_1], "not killed")
+        n = 0
+        for kind, outcomes in self.counts.items():
+            if kinds is None or int(kind) in kinds:
+                n += sum(v for o, v in outcomes.items() if outcome is None or o == outcome)
+        return n
+
+    def table(self):
+        # (outcomes, [(kind label, [count per outcome], total)]) for the templates
+        outcomes = sorted(set(o for v in self.counts.values() for o in v))
+        rows = []
+        for kind in sorted(self.counts, key=int):
+            c = [self.counts[kind].get(o, 0) for o in outcomes]
+            rows.append((Mutant.Kind(int(kind)).label, c, sum(c)))
+        return outcomes, rows
@@ -1,11 +1,13 @@
 import itertools
 import os
 import sys
+import tempfile
+from contextlib import ExitStack
 from heapq import *
-from subprocess import run, DEVNULL
-from django.core.files import File
 from django.db import models
 from django.db.models import Sum
+from ..artifacts import content_storage, digest, store
+from ..instrumentation import stage
 
 
 class SoftwareList(models.Model):
@@ -59,7 +61,55 @@ class SoftwareList(models.Model):
         return r
 
 
+def golden_runs(programs, concurrency=None, retries_left=5, verbose=False, reuse=True):
+    # Golden runs (lst files) of the programs with run_jobs, returns their JobResults. Programs whose golden run
+    # failed retries_left times keep their previous lst. With reuse, programs with the same ELF as an analysed
+    # program (or as another one in programs) link its golden run instead (JobResult with 0 attempts).
+    from ..simulation import JobResult, run_jobs
+    results = [None] * len(programs)
+    run = {}
+    copies = []
+    for n, sw in enumerate(programs):
+        twin = sw.twin() if reuse else None
+        if twin is not None:
+            sw.link_golden_run(twin)
+            results[n] = JobResult(None, "ok", attempts=0)
+        elif reuse and sw.digest and (sw.arch_id, sw.digest) in run:
+            copies.append((n, run[sw.arch_id, sw.digest]))
+        else:
+            run[sw.arch_id, sw.digest or sw.pk] = n
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = {n: os.path.join(tmp, "{}.lst".format(programs[n].pk)) for n in run.values()}
+        # The golden runs share their wall time, every program records it as its gen_lst stage
+        with ExitStack() as stages:
+            for sw in programs:
+                stages.enter_context(stage(sw, "gen_lst"))
+            jobs = run_jobs([programs[n].golden_run_job(f, retries_left - 1) for n, f in files.items()],
+                            concurrency, verbose)
+            for (n, f), result in zip(files.items(), jobs):
+                sw = programs[n]
+                results[n] = result
+                if result.ok:
+                    # Uncompressed: the parsers map it directly and share its page cache (see map_artifact)
+                    store(sw.lst, "{}.lst".format(sw.name), f, compress=False)
+                else:
+                    print("ERROR: golden run of '{}': {} after {} attempts (exit code {}) {}".format(
+                        sw.name, result.status, result.attempts, result.returncode, result.error).rstrip())
+            for n, m in copies:
+                results[n] = JobResult(None, results[m].status, attempts=0)
+                if results[m].ok:
+                    programs[n].link_golden_run(programs[m])
+    return results
+
+
 class SoftwareQuerySet(models.QuerySet):
+    def gen_lst(self, concurrency=None, retries_left=5, verbose=False, reuse=True):
+        # Golden runs of all programs, at most concurrency QEMU processes at the same time. Returns {pk: JobResult}.
+        programs = list(self)
+        results = golden_runs(programs, concurrency, retries_left, verbose, reuse)
+        return {sw.pk: result for sw, result in zip(programs, results)}
+
     def set_cover(self):
 
         subsets = {}
@@ -209,44 +259,83 @@ class Software(models.Model):
     time = models.PositiveIntegerField(default=0)
 
     src = models.FileField(upload_to="src", null=True, blank=True)
-    elf = models.FileField(upload_to="bin", null=True, blank=True)
-    lst = models.FileField(upload_to="analysis", null=True, blank=True)
+    # ELF and golden run are stored content-addressed (shared by programs with the same ELF, see twin())
+    elf = models.FileField(upload_to="bin", storage=content_storage, null=True, blank=True)
+    lst = models.FileField(upload_to="analysis", storage=content_storage, null=True, blank=True)
+    digest = models.CharField(max_length=64, default='', blank=True, db_index=True)
 
     objects = SoftwareQuerySet.as_manager()
 
+    def save(self, *args, **kwargs):
+        # The ELF is committed to the storage during super().save()
+        super().save(*args, **kwargs)
+        d = digest(self.elf) if self.elf else ''
+        if d != self.digest:
+            self.digest = d
+            Software.objects.filter(pk=self.pk).update(digest=d)
+
     def delete(self, using=None, keep_parents=False):
         if self.src and self.src.storage.exists(self.src.name):
             self.src.storage.delete(self.src.name)
-        if self.elf and self.elf.storage.exists(self.elf.name):
-            self.elf.storage.delete(self.elf.name)
-        if self.lst and self.lst.storage.exists(self.lst.name):
-            self.lst.storage.delete(self.lst.name)
+        others = Software.objects.exclude(pk=self.pk)
+        content_storage.release(self.elf, others)
+        content_storage.release(self.lst, others)
         super().delete()
 
-    def gen_lst(self, retries_left=5):
-        try:
-            cmd = ["qemu-system-riscv32",
-                   "-M", self.arch.qemu_machine,
-                   "-cpu", self.arch.qemu_cpu,
-                   "-kernel", self.elf.path,
-                   "-bios", "none", "-device", "terminator,address={}".format(self.arch.qemu_terminator), "-nographic",
-                   "-d", "in_asm,goldenrun", "-D", "/tmp/{}.lst".format(self.name)]
-
-            if retries_left == 0:
-                print("ERROR running '{}' (gave up after 5 attempts)".format(" ".join(cmd)))
-                # TO DO: This does not kill the subprocess pool. But we should really stop here!
-                sys.exit(1)
-
-            run(cmd, check=True, stdout=DEVNULL, stderr=DEVNULL, stdin=DEVNULL, timeout=120, encoding="UTF-8")
-
-            self.lst.save("{}.lst".format(self.name), File(open("/tmp/{}.lst".format(self.name), "rb")))
-            os.remove("/tmp/{}.lst".format(self.name))
-
-        except Exception as e:
-            print("WARNING: Got an Exception while during Software.gen_lst(...).")
-            print("         Exception text was: {}.".format(e))
-            print("         Retrying...")
-            self.gen_lst(retries_left - 1)
+    def twin(self):
+        # Analysed program with the same ELF and architecture, its golden run, coverage and mutant outcomes can be
+        # reused (see golden_runs, analyze_hwcoverage, MutantListManager.create)
+        if not self.digest:
+            return None
+        return Software.objects.filter(arch_id=self.arch_id, digest=self.digest, lst__gt='').exclude(
+            pk=self.pk).order_by('pk').first()
+
+    def link_golden_run(self, twin):
+        self.lst.name = twin.lst.name
+        self.time = twin.time
+        self.save(update_fields=["lst", "time"])
+
+    def copy_coverage(self, twin):
+        from ..ingest import copy_rows
+        from . import GprCoverage, FprCoverage, CsrCoverage, DeviceCsrCoverage, MemoryRegionCoverage, \
+            InstructionCoverage
+        for model in (GprCoverage, FprCoverage, CsrCoverage, DeviceCsrCoverage, MemoryRegionCoverage,
+                      InstructionCoverage):
+            copy_rows(model, "software", twin.pk, self.pk)
+
+    def golden_run_job(self, lst_file, retries=4):
+        from ..simulation import Job, qemu_executable
+        cmd = qemu_executable() + [
+               "-M", self.arch.qemu_machine,
+               "-cpu", self.arch.qemu_cpu,
+               "-kernel", self.elf.path,
+               "-bios", "none", "-device", "terminator,address={}".format(self.arch.qemu_terminator), "-nographic",
+               "-d", "in_asm,goldenrun", "-D", lst_file]
+        return Job(cmd, timeout=120, retries=retries)
+
+    def gen_lst(self, retries_left=5, reuse=True):
+        # Returns the JobResult of the golden run (see SoftwareQuerySet.gen_lst to run many programs at once)
+        return golden_runs([self], retries_left=retries_left, reuse=reuse)[0]
 
     def get_gpr_rwx(self):
         return self.gprcoverage.aggregate(total=Sum('x'), reads=Sum('r'), writes=Sum('w'))
+
+
+class StageMetric(models.Model):
+    # Resources used by one stage of the analysis of a program, per category if the stage has several
+    # (see webapp/instrumentation.py). rss is the growth of the peak RSS of the analysis process during the stage (KiB):
+    # the process-wide peak only grows, a stage that stays below the peak of an earlier one records 0.
+    software = models.ForeignKey("Software", related_name="metrics", on_delete=models.CASCADE)
+    stage = models.CharField(max_length=40)
+    category = models.CharField(max_length=40, blank=True, default='')
+    started = models.DateTimeField()
+    wall = models.FloatField()
+    cpu = models.FloatField()
+    cpu_children = models.FloatField()
+    rss = models.BigIntegerField()
+    queries = models.PositiveIntegerField()
+    rows = models.BigIntegerField()
+
+    def __str__(self):
+        return "StageMetric[{}, {}{}: {:.3f} s]".format(self.software_id, self.stage,
+                                                       "/" + self.category if self.category else "", self.wall)
@@ -0,0 +1,66 @@
+import math
+import random
+from statistics import NormalDist
+
+
+def z_value(confidence):
+    return NormalDist().inv_cdf(0.5 + confidence / 2.0)
+
+
+def sample_size(population, margin, confidence, p=0.5):
+    # Sample size for estimating a proportion p with the given margin of error (incl. finite population correction)
+    if population == 0:
+        return 0
+    n0 = z_value(confidence) ** 2 * p * (1.0 - p) / margin ** 2
+    return min(population, int(math.ceil(n0 / (1.0 + (n0 - 1.0) / population))))
+
+
+def allocate(n, pools):
+    # Proportional allocation of n samples to strata {key: pool size} (largest remainder method)
+    total = sum(pools.values())
+    if total == 0 or n <= 0:
+        return {}
+    n = min(n, total)
+    quota = {k: n * v / total for k, v in pools.items()}
+    r = {k: int(q) for k, q in quota.items()}
+    for k in sorted(quota, key=lambda x: quota[x] - r[x], reverse=True)[:n - sum(r.values())]:
+        r[k] += 1
+    return {k: v for k, v in r.items() if v > 0}
+
+
+def draw(pool, n):
+    # Random sample of n ids out of pool
+    return random.sample(pool, min(n, len(pool)))
+
+
+def wilson(killed, n, confidence):
+    # Wilson score interval of a proportion
+    if n == 0:
+        return 0.0, 1.0
+    z = z_value(confidence)
+    p = killed / n
+    d = 1.0 + z ** 2 / n
+    c = (p + z ** 2 / (2 * n)) / d
+    h = z * math.sqrt(p * (1.0 - p) / n + z ** 2 / (4 * n ** 2)) / d
+    return max(0.0, c - h), min(1.0, c + h)
+
+
+def stratified(strata, confidence):
+    # Stratified estimate of the kill rate for strata [(population, sampled, killed)]. Returns (rate, margin).
+    population = sum(s[0] for s in strata)
+    if population == 0:
+        return 0.0, 0.0
+    rate = 0.0
+    var = 0.0
+    for N, n, k in strata:
+        w = N / population
+        if n == 0:
+            # No information on this stratum yet: assume the worst case
+            rate += w * 0.5
+            var += w ** 2 * 0.25
+            continue
+        p = k / n
+        rate += w * p
+        s2 = 0.25 if n == 1 else p * (1.0 - p) * n / (n - 1)
+        var += w ** 2 * (1.0 - n / N) * s2 / n
+    return rate, z_value(confidence) * math.sqrt(var)
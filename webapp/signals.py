@@ -0,0 +1,108 @@
+import functools
+import threading
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from . import coverage
+from .caching import invalidate
+from .models import Architecture, Csr, Device, DeviceCsr, Fpr, Gpr, Instruction, MemoryRegion, Mutant, MutantList, \
+    Operand, Software, SoftwareList, Subset
+
+# Architecture of subsets and devices (they never move to another one), so that imports and cascading deletes do not
+# need a query per instruction or register
+_arch_of = {}
+
+
+def _arch(model, pk):
+    if (model, pk) not in _arch_of:
+        _arch_of[model, pk] = model.objects.filter(pk=pk).values_list("arch_id", flat=True).first()
+    return _arch_of[model, pk]
+
+
+# Architecture of an instance of the ISA models (None: shared by all architectures)
+ARCH = {
+    Architecture: lambda x: x.pk,
+    Subset: lambda x: x.arch_id,
+    Instruction: lambda x: _arch(Subset, x.subset_id),
+    Gpr: lambda x: _arch(Subset, x.subset_id),
+    Fpr: lambda x: _arch(Subset, x.subset_id),
+    Csr: lambda x: _arch(Subset, x.subset_id),
+    Device: lambda x: x.arch_id,
+    DeviceCsr: lambda x: _arch(Device, x.device_id),
+    MemoryRegion: lambda x: x.arch_id,
+    Operand: lambda x: None,
+}
+# NOTE: InstructionFaults are bulk created (no signals), code that imports or generates them calls
+# caching.invalidate(arch_id) afterwards (see tools/Benchmark.py). Receivers for InstructionFault would also disable the
+# fast delete of their millions of rows.
+
+
+def isa_changed(sender, instance, **kwargs):
+    invalidate(ARCH[sender](instance))
+
+
+def isa_deleted(sender, instance, **kwargs):
+    invalidate(ARCH[sender](instance))
+    if sender in (Subset, Device):
+        _arch_of.pop((sender, instance.pk), None)
+
+
+for model in ARCH:
+    post_save.connect(isa_changed, sender=model)
+    post_delete.connect(isa_deleted, sender=model)
+
+
+# Coverage summaries of the software lists (see coverage.summary). NOTE: Coverage rows are created without signals,
+# analyze_hwcoverage outdates the lists of the analysed program.
+def softwarelist_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            coverage.invalidate([instance.pk])
+    elif action in ("post_add", "post_remove"):
+        coverage.invalidate(pk_set)
+    elif action == "pre_clear":
+        coverage.invalidate_programs([instance.pk])
+
+
+# Deleted programs: collected and applied once when the transaction of the (cascading) delete commits, so that deleting
+# N programs outdates the list summaries once (their memberships vanish without m2m signals) and updates each matrix
+# once. The pending programs of a rolled back transaction are applied with the next one (harmless: rows are reread).
+_pending = threading.local()
+
+
+def _apply(using):
+    pending = getattr(_pending, using, None)
+    if pending is None:
+        return
+    delattr(_pending, using)
+    coverage.invalidate_all()
+    for arch_id, pks in pending.items():
+        coverage.update_matrix(arch_id, list(pks))
+
+
+def software_deleted(sender, instance, using, **kwargs):
+    pending = getattr(_pending, using, None)
+    if pending is None:
+        pending = {}
+        setattr(_pending, using, pending)
+    pending.setdefault(instance.arch_id, set()).add(instance.pk)
+    transaction.on_commit(functools.partial(_apply, using), using=using)
+
+
+m2m_changed.connect(softwarelist_changed, sender=SoftwareList.software.through)
+post_delete.connect(software_deleted, sender=Software)
+
+
+# Mutant lists linked to a deleted list (see MutantList.link_results): the first one takes over its mutants (before
+# they are deleted) and files, the others are linked to it
+def mutantlist_deleting(sender, instance, **kwargs):
+    linked = list(MutantList.objects.filter(copied_from=instance).order_by('pk').values_list('pk', flat=True))
+    if len(linked) == 0:
+        return
+    heir = linked[0]
+    Mutant.objects.filter(parent_id=instance.pk).update(parent_id=heir)
+    MutantList.objects.filter(pk=heir).update(copied_from=None, mutantlist=instance.mutantlist.name or None,
+                                              testresults=instance.testresults.name or None)
+    MutantList.objects.filter(pk__in=linked[1:]).update(copied_from=heir)
+
+
+pre_delete.connect(mutantlist_deleting, sender=MutantList)
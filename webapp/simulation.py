@@ -0,0 +1,340 @@
+import asyncio
+import functools
+import heapq
+import math
+import os
+import re
+import shlex
+from subprocess import DEVNULL
+from django.conf import settings
+from django.db.models import Case, Count, F, Q, Sum, When
+from .ingest import parse_test_report
+
+# Budget for a single mutant: TIMEOUT_FACTOR x runtime of the golden run + TIMEOUT_OFFSET (us)
+TIMEOUT_FACTOR = 10
+TIMEOUT_OFFSET = 1000000
+POLL_INTERVAL = 0.1
+# A crashed QEMU process is restarted up to SIMULATION_RETRIES times, the n-th time after RETRY_DELAY * 2^(n-1) s
+SIMULATION_RETRIES = 2
+RETRY_DELAY = 1.0
+# Result of a mutant that crashes QEMU every time
+CRASH_OUTCOME = "simulator crash"
+# Number of simulated lists of other programs the per-kind runtime priors are taken from
+PRIOR_LISTS = 50
+
+
+def qemu_executable():
+    # Simulator command line prefix (settings.QEMU_COMMAND), e.g. ["python3", "tools/FakeQemu.py"]
+    return shlex.split(settings.QEMU_COMMAND)
+
+
+@functools.cache
+def ifr_kinds():
+    from .models import Mutant
+    return frozenset(k.value for k in Mutant.Kind if k.name.startswith("IFR"))
+
+
+def site_of(kind, site, bitflip):
+    # Site of a mutant for the cost groups and shards: all IFR mutants share the fault register, they are grouped by
+    # their bit mask instead, so that they can be spread over the shards
+    return bitflip if kind in ifr_kinds() else site
+
+
+def kind_priors(ml):
+    # Mean runtime per kind relative to the golden run, from the summaries of simulated lists of other programs of
+    # the architecture (runtime bucket b holds runtimes in [2^(b-1), 2^b) us, counted with 3/4 * 2^b):
+    # {kind: runtime / golden run time}
+    from .models import MutantListSummary
+    totals = {}
+    for runtimes, golden in MutantListSummary.objects.filter(
+            mutantlist__software__arch_id=ml.software.arch_id, mutantlist__software__time__gt=0).exclude(
+            mutantlist=ml).order_by('-updated').values_list('runtimes', 'mutantlist__software__time')[:PRIOR_LISTS]:
+        for kind, buckets in runtimes.items():
+            n = sum(buckets[1:])
+            if n > 0:
+                t = totals.get(int(kind), (0, 0.0))
+                totals[int(kind)] = (t[0] + n, t[1] + sum(c * 0.75 * 2 ** b for b, c in enumerate(buckets) if b > 0) /
+                                     golden)
+    return {kind: ratio / n for kind, (n, ratio) in totals.items()}
+
+
+def estimate_costs(ml, mutants):
+    # Predicted runtime (us) per group of mutants (kind, site, access): {(kind, site, access): (count, cost)}
+    # Mutants that have been simulated before count with their own runtime, all others with the mean runtime of
+    # simulated mutants of the same kind and site, of the same kind, the mean runtime of the kind in other lists
+    # (relative to the golden run, see kind_priors), or the runtime of the golden run (in this order).
+    from .models import Outcome
+    done = ~Q(outcome=Outcome.UNKNOWN) & Q(runtime__gt=0)
+    groups = {}
+    sites = {}
+    kinds = {}
+    for kind, site, access, n, d, t in mutants.annotate(
+            site=Case(When(kind__in=ifr_kinds(), then=F('bitflip')), default=F('nr_or_address'))).values(
+            'kind', 'site', 'access_idx').annotate(
+            n=Count('id'), d=Count('id', filter=done), t=Sum('runtime', filter=done)).values_list(
+            'kind', 'site', 'access_idx', 'n', 'd', 't').order_by():
+        t = t or 0
+        groups[kind, site, access] = (n, d, t)
+        s = sites.get((kind, site), (0, 0))
+        sites[kind, site] = (s[0] + d, s[1] + t)
+        k = kinds.get(kind, (0, 0))
+        kinds[kind] = (k[0] + d, k[1] + t)
+
+    default = max(1, ml.software.time)
+    priors = kind_priors(ml) if any(k[0] == 0 for k in kinds.values()) else {}
+    r = {}
+    for (kind, site, access), (n, d, t) in groups.items():
+        if sites[kind, site][0] > 0:
+            mean = sites[kind, site][1] / sites[kind, site][0]
+        elif kinds[kind][0] > 0:
+            mean = kinds[kind][1] / kinds[kind][0]
+        elif kind in priors:
+            mean = max(1.0, priors[kind] * default)
+        else:
+            mean = default
+        r[kind, site, access] = (n, t + (n - d) * mean)
+    return r
+
+
+def lpt(costs, n):
+    # Longest-processing-time-first packing of {key: cost} into n shards: ({key: shard}, [load per shard])
+    loads = [(0, s) for s in range(n)]
+    heapq.heapify(loads)
+    shard_of = {}
+    for key in sorted(costs, key=lambda k: costs[k], reverse=True):
+        load, s = heapq.heappop(loads)
+        shard_of[key] = s
+        heapq.heappush(loads, (load + costs[key], s))
+    return shard_of, [load for load, s in sorted(loads, key=lambda x: x[1])]
+
+
+def shard_mutants(ml, mutants, n):
+    # Assign all mutants to n shards with about the same predicted runtime: ({(kind, site, access): shard}, loads)
+    # with the site of site_of()
+    return lpt({k: v[1] for k, v in estimate_costs(ml, mutants).items()}, n)
+
+
+def timeout_budget(golden, factor=TIMEOUT_FACTOR, offset=TIMEOUT_OFFSET):
+    # Wall time (s) a QEMU process may spend on a single mutant, for a golden run of golden us
+    return (factor * golden + offset) / 1e6
+
+
+def golden_time(report):
+    # Runtime of the golden run (us) from the head of a test report, None if QEMU has not finished it yet
+    with open(report, 'r') as f:
+        head = f.read(4096)
+    m = re_golden.search(head)
+    return int(m.group(1), 10) if m is not None else None
+
+
+re_golden = re.compile(r"#\s+Golden run took\s+(\d+) us")
+
+
+class Job:
+    # A QEMU run, started after delay seconds: killed after timeout seconds in total or (with report) after stall
+    # seconds without the report file growing. With calibrate, the stall timer is only armed once QEMU has written
+    # the golden run line to the report (QEMU startup and its own golden run come first), then
+    # stall = calibrate(golden run time in us). Failed or timed out attempts are repeated up to retries times, the
+    # n-th retry after RETRY_DELAY * 2^(n-1) seconds.
+    def __init__(self, cmd, timeout=None, report=None, stall=None, retries=0, delay=0.0, calibrate=None):
+        self.cmd = cmd
+        self.timeout = timeout
+        self.report = report
+        self.stall = stall
+        self.retries = retries
+        self.delay = delay
+        self.calibrate = calibrate
+
+
+class JobResult:
+    # status: "ok", "failed" (exit code != 0 or could not be started), "timeout" or "stalled"
+    def __init__(self, job, status, returncode=None, attempts=1, error=""):
+        self.job = job
+        self.status = status
+        self.returncode = returncode
+        self.attempts = attempts
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.status == "ok"
+
+    def __str__(self):
+        return "JobResult[{}, rc:{}, attempts:{}{}]".format(self.status, self.returncode, self.attempts,
+                                                           ", " + self.error if self.error else "")
+
+
+async def _kill(proc):
+    try:
+        proc.kill()
+    except ProcessLookupError:
+        pass
+    await proc.wait()
+
+
+async def _attempt(job, verbose):
+    try:
+        proc = await asyncio.create_subprocess_exec(*job.cmd, stdin=DEVNULL, stdout=DEVNULL,
+                                                    stderr=None if verbose else DEVNULL)
+    except OSError as e:
+        return "failed", None, str(e)
+
+    loop = asyncio.get_running_loop()
+    start = last = loop.time()
+    size = -1
+    stall = job.stall if job.calibrate is None else None
+    waiter = asyncio.ensure_future(proc.wait())
+    try:
+        while True:
+            done, pending = await asyncio.wait({waiter}, timeout=POLL_INTERVAL)
+            if done:
+                return ("ok" if proc.returncode == 0 else "failed"), proc.returncode, ""
+            now = loop.time()
+            if job.timeout is not None and now - start > job.timeout:
+                await _kill(proc)
+                return "timeout", None, "killed after {:.1f} s".format(job.timeout)
+            if stall is not None or job.calibrate is not None:
+                s = os.path.getsize(job.report) if os.path.exists(job.report) else 0
+                if s != size:
+                    size, last = s, now
+                    if stall is None:
+                        golden = golden_time(job.report)
+                        if golden is not None:
+                            stall = job.stall = job.calibrate(golden)
+                elif stall is not None and now - last > stall:
+                    await _kill(proc)
+                    return "stalled", None, "killed after {:.1f} s without progress".format(stall)
+    except asyncio.CancelledError:
+        await _kill(proc)
+        raise
+
+
+async def _run(job, limit, verbose):
+    async with limit:
+        if job.delay > 0:
+            await asyncio.sleep(job.delay)
+        attempt = 0
+        while True:
+            if attempt > 0:
+                await asyncio.sleep(RETRY_DELAY * 2 ** (attempt - 1))
+            status, rc, error = await _attempt(job, verbose)
+            attempt += 1
+            if status in ("ok", "stalled") or attempt > job.retries:
+                return JobResult(job, status, rc, attempt, error)
+            if verbose:
+                print("WARNING: {} ({}), retrying: {}".format(status, error or "rc {}".format(rc), " ".join(job.cmd)))
+
+
+async def _run_all(jobs, concurrency, verbose):
+    limit = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*[_run(job, limit, verbose) for job in jobs])
+
+
+def run_jobs(jobs, concurrency=None, verbose=True):
+    # Run all jobs, at most concurrency (default: number of CPUs) at the same time. Returns a JobResult per job.
+    # Interrupting the call kills all running processes.
+    if len(jobs) == 0:
+        return []
+    return asyncio.run(_run_all(jobs, concurrency or os.cpu_count() or 1, verbose))
+
+
+def _remaining(mutant_file, report_file, rest_file, skip_first):
+    # Write the mutants of mutant_file without result in report_file to rest_file. Returns the first of them if it
+    # is skipped (the mutant the process hung on) and the number of mutants written.
+    done = set()
+    if os.path.exists(report_file):
+        with open(report_file, 'r') as f:
+            done = set(p[0] for p in parse_test_report(f, []))
+    first = None
+    n = 0
+    with open(mutant_file, 'r') as f, open(rest_file, 'w') as out:
+        out.write("#id,kind,address/regnum,nracc,biterror\n")
+        for line in f:
+            if line.startswith('#') or int(line.split(',', 1)[0], 10) in done:
+                continue
+            if skip_first and first is None:
+                first = int(line.split(',', 1)[0], 10)
+                continue
+            out.write(line)
+            n += 1
+    return first, n
+
+
+async def _supervise(command, mutant_file, budget, limit, verbose, retries, state):
+    # Simulate one mutant list, restarting it behind the mutant a process hung on or crashed on as soon as it ended
+    failed = 0
+    pending = math.inf
+    m = mutant_file
+    while True:
+        r = m.replace(".mutants", ".testreport")
+        delay = RETRY_DELAY * 2 ** (failed - 1) if failed > 0 else 0.0
+        result = await _run(Job(command(m, r), report=r, calibrate=budget, delay=delay), limit, verbose)
+        if os.path.exists(r):
+            state["reports"].append(r)
+        if result.ok:
+            return
+
+        state["restarts"] += 1
+        rest = mutant_file.replace(".mutants", "_{}.mutants".format(state["restarts"]))
+        stalled = result.status == "stalled"
+        first, n = _remaining(m, r, rest, stalled)
+        if n < pending:
+            # Got further than the last time
+            failed = 0
+        pending = n
+        # QEMU crashed retries + 1 times after its golden run without progress: the mutant it was simulating
+        # crashes it
+        crashed = not stalled and failed >= retries and os.path.exists(r) and golden_time(r) is not None
+        if crashed:
+            first, n = _remaining(m, r, rest, True)
+        if stalled and first is not None:
+            if verbose:
+                print("WARNING: killed QEMU after {:.1f} s without progress on mutant {}".format(
+                    result.job.stall, first))
+            state["timeouts"].append((first, result.job.stall))
+            failed = 0
+        elif crashed and first is not None:
+            print("WARNING: QEMU {} on mutant {} {} times, skipped ({}).".format(result.status, first, failed + 1,
+                                                                                 result))
+            state["crashes"].append(first)
+            failed = 0
+        elif failed >= retries:
+            print("WARNING: gave up on {} mutants ({}).".format(n, result))
+            state["failures"].append(result)
+            return
+        else:
+            failed += 1
+            if verbose:
+                print("WARNING: QEMU {}, restarting {} mutants ({}).".format(result.status, n, result))
+        if n == 0:
+            return
+        m = rest
+
+
+async def _supervise_all(command, mutant_files, budget, concurrency, verbose, retries, state):
+    limit = asyncio.Semaphore(concurrency)
+    await asyncio.gather(*[_supervise(command, m, budget, limit, verbose, retries, state) for m in mutant_files])
+
+
+def run_supervised(command, mutant_files, budget=None, verbose=True, concurrency=None, retries=SIMULATION_RETRIES):
+    # Simulate all mutant lists, one process each (command(mutant_file, report_file) -> cmd), at most concurrency at
+    # the same time. A process that hangs (longer than budget(golden run time in us) seconds without a result, see
+    # Job.calibrate) is killed and restarted behind the mutant it hung on, which is reported as timeout. A process
+    # that crashes is restarted behind its last result, after retries + 1 crashes on the same mutant that mutant is
+    # reported as CRASH_OUTCOME. Restarts are queued as soon as the process ended. Returns all test reports and the
+    # JobResults of the mutant lists that could not be completed (QEMU did not get through its golden run).
+    state = {"reports": [], "timeouts": [], "crashes": [], "failures": [], "restarts": 0}
+    if len(mutant_files) > 0:
+        asyncio.run(_supervise_all(command, mutant_files, budget, concurrency or os.cpu_count() or 1, verbose,
+                                   retries, state))
+
+    reports = state["reports"]
+    if len(state["timeouts"]) > 0 or len(state["crashes"]) > 0:
+        r = mutant_files[0].replace(".mutants", "_timeouts.testreport")
+        with open(r, 'w') as f:
+            for i, stall in state["timeouts"]:
+                f.write("  {}, timeout, {} us\n".format(i, int(stall * 1e6)))
+            for i in state["crashes"]:
+                f.write("  {}, {}, 0 us\n".format(i, CRASH_OUTCOME))
+        reports.append(r)
+    return reports, state["failures"]
@@ -0,0 +1,60 @@
+import unittest
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from tools.Benchmark import make_architecture
+from webapp.ingest import RowStream, copy_results
+from webapp.models import Mutant, MutantList, Software
+
+# Outcome texts with the separators and the escape character of COPY's text format
+TEXTS = ["wrong result", "trap:\tcause 2", "line\nbreak", "carriage\rreturn", "back\\slash"]
+UNESCAPE = {"\\": "\\", "t": "\t", "n": "\n", "r": "\r"}
+
+
+def parse_copy_text(data):
+    # Rows of COPY's text format (only the escapes that RowStream writes)
+    rows = []
+    for line in data.split("\n")[:-1]:
+        row = []
+        for field in line.split("\t"):
+            value, escaped = "", False
+            for ch in field:
+                if escaped:
+                    value += UNESCAPE[ch]
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                else:
+                    value += ch
+            row.append(value)
+        rows.append(tuple(row))
+    return rows
+
+
+class RowStreamTest(SimpleTestCase):
+    def test_escapes(self):
+        rows = [(n, text, 10 * n) for n, text in enumerate(TEXTS)]
+        self.assertEqual(parse_copy_text(RowStream(iter(rows)).read()), [(str(a), b, str(c)) for a, b, c in rows])
+
+    def test_chunks(self):
+        rows = [(n, text, 10 * n) for n, text in enumerate(TEXTS)]
+        stream = RowStream(iter(rows))
+        data = ""
+        while True:
+            chunk = stream.read(7)
+            if chunk == "":
+                break
+            data += chunk
+        self.assertEqual(data, RowStream(iter(rows)).read())
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "COPY needs PostgreSQL")
+class CopyResultsTest(TestCase):
+    def test_outcome_texts(self):
+        software = Software.objects.create(arch=make_architecture(), name="test")
+        ml = MutantList(software=software)
+        ml.save()
+        mutants = Mutant.objects.bulk_create([Mutant(parent=ml, kind=Mutant.Kind.GPR_PERMANENT_FLIP, nr_or_address=1,
+                                                     bitflip=1 << n) for n in range(len(TEXTS))])
+        copy_results(ml, [(m.pk, text, 10 * n) for n, (m, text) in enumerate(zip(mutants, TEXTS))])
+        self.assertEqual([(m.detected_error, m.runtime) for m in ml.mutants.order_by("pk")],
+                         [(text, 10 * n) for n, text in enumerate(TEXTS)])
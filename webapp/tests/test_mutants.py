@@ -0,0 +1,50 @@
+import os
+import shlex
+import sys
+import tempfile
+from unittest import mock
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from tools.Benchmark import BASE_DIR, make_architecture
+from webapp.models import Mutant, MutantList, Outcome, Software
+from webapp.utils import analyze_hwcoverage
+
+# Synthetic golden runs and test reports (see tools/FakeQemu.py), small enough for a test
+FAKE_QEMU = " ".join(shlex.quote(x) for x in [sys.executable, os.path.join(BASE_DIR, "tools", "FakeQemu.py")])
+FAKE_QEMU_ENV = {"FAKE_QEMU_INSNS": "32", "FAKE_QEMU_ITERATIONS": "3", "FAKE_QEMU_STARTUP": "0"}
+
+
+class FakeQemuTestCase(TestCase):
+    # Runs QEMU_COMMAND as FakeQemu with its files in a temporary MEDIA_ROOT
+    @classmethod
+    def setUpClass(cls):
+        media = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(media.cleanup)
+        for context in (override_settings(MEDIA_ROOT=media.name, QEMU_COMMAND=FAKE_QEMU),
+                        mock.patch.dict(os.environ, FAKE_QEMU_ENV)):
+            context.__enter__()
+            cls.addClassCleanup(context.__exit__, None, None, None)
+        super().setUpClass()
+
+
+class MutantGenerationTest(FakeQemuTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.software = Software.objects.create(arch=make_architecture(), name="test")
+        cls.software.elf.save("test.elf", ContentFile(b""))
+        cls.software.gen_lst()
+        analyze_hwcoverage(cls.software)
+
+    def test_collapsing_with_imem_prediction(self):
+        # Every collapsed mutant gets the outcome of its representative once the simulated mutants have one
+        ml = MutantList.objects.create(software=self.software, reuse=False, with_gpr=False, with_csr=False,
+                                       with_ifr=False, with_transient_faults=False, with_fault_collapsing=True,
+                                       with_imem_prediction=True)
+        equivalent = ml.mutants.filter(prediction=Mutant.Prediction.EQUIVALENT)
+        self.assertTrue(equivalent.exists())
+        self.assertTrue(ml.mutants.filter(prediction=Mutant.Prediction.ILLEGAL_INSTRUCTION).exists())
+
+        ml.mutants.filter(simulate=True).update(outcome=Outcome.objects.code("wrong result"))
+        ml.expand_equivalent()
+        self.assertFalse(equivalent.filter(outcome=Outcome.UNKNOWN).exists())
@@ -0,0 +1,45 @@
+import os
+import tempfile
+from django.test import TestCase
+from tools.Benchmark import make_architecture
+from tools.GoldenRunParser import GoldenRunParser
+
+# Disassembly lines with and without 0x prefix, followed by the summary of the golden run
+GOLDEN_RUN = b"""----------------
+IN:
+0x20400000:  00100093          addi            ra,zero,1
+20400004:  0000a103          lw              sp,0(ra)
+20400008:\t00208133\tadd\tsp,ra,sp
+LD/ST for GPR 1 (Access 1): [80000000 + 0]
+GPR[1]:2,1,3
+EXE[20400000]:1
+EXE[20400004]:1
+EXE[20400008]:1
+MEM_32[80000000]:1,0,1
+"""
+
+
+class GoldenRunParserTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.arch = make_architecture()
+
+    def setUp(self):
+        f = tempfile.NamedTemporaryFile(suffix=".lst", delete=False)
+        self.addCleanup(os.remove, f.name)
+        with f:
+            f.write(GOLDEN_RUN)
+        self.path = f.name
+
+    def test_instructions_with_and_without_prefix(self):
+        with GoldenRunParser(self.arch, self.path) as dp:
+            self.assertEqual(dp.pc2word, {0x20400000: 0x00100093, 0x20400004: 0x0000a103, 0x20400008: 0x00208133,
+                                          0x00001004: 0x02828613, 0x00001008: 0xf1402573})
+            self.assertEqual([(a, i.name.lower()) for a, i in dp.get_instruction_faults()],
+                             [(0x20400000, "addi"), (0x20400004, "lw"), (0x20400008, "add")])
+            self.assertEqual(dp.get_pc_executions(), {0x20400000: 1, 0x20400004: 1, 0x20400008: 1})
+            self.assertEqual(dp.filter_gprs, {(1, 1): (0x80000000, 0)})
+
+    def test_registers(self):
+        self.assertEqual(GoldenRunParser.get_registers("20400004:  0000a103          lw              sp,0(ra)"),
+                         {"sp", "ra"})
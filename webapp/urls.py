@@ -14,15 +14,27 @@ urlpatterns = [
 
     re_path(r'^softwarelist/(?P<softwarelist_id>[0-9]+)/$', views.softwarelist, name='softwarelist'),
     re_path(r'^software/(?P<software_id>[0-9]+)/$', views.software, name='software'),
+    re_path(r'^software/(?P<software_id>[0-9]+)/metrics/(?P<fmt>jsonl|prometheus)/$', views.metrics_export,
+            name='software_metrics'),
+    re_path(r'^metrics/(?P<fmt>jsonl|prometheus)/$', views.metrics_export, name='metrics'),
+    re_path(r'^performance/$', views.performance, name='performance'),
 
     re_path(r'^mutantlist/(?P<mutantlist_id>[0-9]+)/$', views.mutantlist, name='mutantlist'),
+    re_path(r'^mutantlist/(?P<mutantlist_id>[0-9]+)/export/(?P<fmt>csv|ndjson)/$', views.mutantlist_export,
+            name='mutantlist_export'),
     
     re_path(r'^ajax/faulteffect/(?P<instruction_id>[0-9]+)/(?P<fault_mask>[0-9]+)/$', ajax.fault_effect,
             name='ajax_faulteffect'),
     
     re_path(r'^json/encoding/(?P<instruction_id>[0-9]+)/$', json.encoding, name='json_encoding'),
     re_path(r'^json/encoding/(?P<instruction_id>[0-9]+)/(?P<fault_mask>[0-9]+)/$', json.encoding, name='json_encoding'),
+    re_path(r'^json/faulteffects/(?P<instruction_id>[0-9]+)/$', json.fault_effects, name='json_faulteffects'),
+    re_path(r'^json/faulteffects/(?P<instruction_id>[0-9]+)/(?P<distance>[0-9]+)/$', json.fault_effects,
+            name='json_faulteffects'),
     re_path(r'^json/testrelevance/(?P<arch_id>[0-9]+)/(?P<bits>[0-9]+)/$', json.testrelevance, name='testrelevance'),
     re_path(r'^json/faultdistribution/(?P<arch_id>[0-9]+)/$', json.faultdistribution, name='faultdistribution'),
+    re_path(r'^json/mutantlist/(?P<mutantlist_id>[0-9]+)/$', json.mutantlist, name='json_mutantlist'),
+    re_path(r'^json/mutantlist/(?P<mutantlist_id>[0-9]+)/summary/$', json.mutantlist_summary,
+            name='json_mutantlist_summary'),
     re_path(r'^json/chartdata/(?P<instruction_id>[0-9]+)/(?P<distance>[0-9]+)/$', json.chartdata, name='chartdata'),
 ]
@@ -1,2 +1,3 @@
 from .hardware import *
-from .software import *
\ No newline at end of file
+from .software import *
+from .performance import *
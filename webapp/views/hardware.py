@@ -1,10 +1,9 @@
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render
+from .. import caching
 from ..models import *
 
 
-def architecture_faults(request, arch_id):
-    
-    a = Architecture.objects.get(pk=arch_id)
+def fault_statistics(a):
     # Things to consider:
     # - Average nr of faults per
     #   - 16 Bit Instruction (1, 2, 3, [1-3])
@@ -58,25 +57,31 @@ def architecture_faults(request, arch_id):
     if (faults[0] + faults[1]) > 0:
         percent[2] = round((relevant_faults[2] / float(faults[2])) * 100.0, 2)
     
-    return render(request, 
-                  'architecture/faults.html',
-                  {
-                      'arch': a,
-                      'nav_id': 1,
-                      'icount': icount,
-                      'faults': faults,
-                      'dc_faults': dc_faults,
-                      'illegal_faults': illegal_faults,
-                      'relevant_faults': relevant_faults,
-                      'other': Instruction.objects.filter(subset__arch=a).order_by('name'),
-                      'percent': percent,
-                  })
+    return {
+        'icount': icount,
+        'faults': faults,
+        'dc_faults': dc_faults,
+        'illegal_faults': illegal_faults,
+        'relevant_faults': relevant_faults,
+        'percent': percent,
+    }
+
+
+def architecture_faults(request, arch_id):
+    a = caching.architecture(arch_id)
+    context = {
+        'arch': a,
+        'nav_id': 1,
+        'other': caching.navigation(a.id),
+    }
+    context.update(caching.cached(a.id, "faults", lambda: fault_statistics(a)))
+    return render(request, 'architecture/faults.html', context)
 
 
 def detail(request, instruction_id):
-    instruction = get_object_or_404(Instruction, pk=instruction_id)
+    instruction = caching.instruction(instruction_id)
     a = instruction.subset.arch
-    other = Instruction.objects.filter(subset__arch_id=a.id).order_by('name')
+    other = caching.navigation(a.id)
     return render(request,
                   'instruction/detail.html',
                   {
@@ -88,9 +93,9 @@ def detail(request, instruction_id):
 
 
 def interactive(request, instruction_id):
-    instruction = get_object_or_404(Instruction, pk=instruction_id)
+    instruction = caching.instruction(instruction_id)
     a = instruction.subset.arch
-    other = Instruction.objects.filter(subset__arch_id=a.id).order_by('name')
+    other = caching.navigation(a.id)
     return render(request,
                   'instruction/bitflip.html',
                   {
@@ -129,23 +134,26 @@ def css(request, file):
 
 
 def architecture_mapping(request, arch_id):
-    arch = get_object_or_404(Architecture, pk=arch_id)
+    arch = caching.architecture(arch_id)
 
+    # The tables are cached as rendered fragment (see the template), the querysets are only evaluated on a miss
     return render(request,
                   "architecture/mapping.html",
                   {
                       'arch': arch,
+                      'isa_version': caching.version(arch.id),
                       'gprs': Gpr.objects.filter(subset__arch=arch),
                       'fprs': Fpr.objects.filter(subset__arch=arch),
                       'csrs': Csr.objects.filter(subset__arch=arch),
-                      'dev_csrs': DeviceCsr.objects.filter(device__arch=arch).order_by('number'),
-                      'mem_regions':
-                          MemoryRegion.objects.filter(arch=arch).exclude(memtype="CSR").order_by('addr_from'),
+                      'dev_csrs':
+                          DeviceCsr.objects.filter(device__arch=arch).select_related('device').order_by('number'),
+                      'mem_regions': MemoryRegion.objects.filter(arch=arch).exclude(memtype="CSR").select_related(
+                          'device').order_by('addr_from'),
                   })
 
 
 def architecture(request, arch_id):
-    arch = get_object_or_404(Architecture, pk=arch_id)
+    arch = caching.architecture(arch_id)
     slists = SoftwareList.objects.filter(software__arch_id=arch_id).distinct()
 
     return render(request,
@@ -0,0 +1,33 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.shortcuts import render
+from ..middleware import LATENCY_BUCKETS, all_stats, percentile
+
+
+@staff_member_required
+def performance(request):
+    # Latency and query statistics per view, collected by QueryBudgetMiddleware (all server processes)
+    stats = list(all_stats().items())
+
+    views = []
+    for name, s in sorted(stats, key=lambda x: x[1].time, reverse=True):
+        views.append({
+            'name': name,
+            'requests': s.requests,
+            'mean': s.time / s.requests,
+            'p50': percentile(s.histogram, 0.5),
+            'p95': percentile(s.histogram, 0.95),
+            'max': s.max_time,
+            'queries': s.queries / s.requests,
+            'max_queries': s.max_queries,
+            'slow': s.slow,
+            'over_budget': s.over_budget,
+            'histogram': list(s.histogram),
+            'repeated': sorted(s.repeated.items(), key=lambda x: x[1], reverse=True)[:5],
+        })
+
+    return render(request,
+                  "performance/report.html",
+                  {
+                      'views': views,
+                      'buckets': ["≤{:g} s".format(b) for b in LATENCY_BUCKETS] + ["slower"],
+                  })
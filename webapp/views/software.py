@@ -1,11 +1,30 @@
+import csv
+import itertools
+import json
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
 from django.db.models import Sum
-from ..models import SoftwareList, Software, MemoryRegionCoverage, GprCoverage, FprCoverage, CsrCoverage, \
-    DeviceCsrCoverage, MemoryRegion, Gpr, Fpr, Csr, DeviceCsr, MutantList
+from .. import coverage
+from ..instrumentation import as_jsonl, as_prometheus
+from ..models import SoftwareList, Software, MutantList, MutantListSummary, Mutant, Outcome, StageMetric
+
+# Mutant kinds where nr_or_address is a memory address
+HEX_ADDRESS_KINDS = {
+    Mutant.Kind.IMEM_PERMANENT_FLIP, Mutant.Kind.IMEM_PERMANENT_SA_0, Mutant.Kind.IMEM_PERMANENT_SA_1,
+    Mutant.Kind.COREMEM_PERMANENT_FLIP, Mutant.Kind.COREMEM_PERMANENT_SA_0, Mutant.Kind.COREMEM_PERMANENT_SA_1,
+}
+
+
+def outcome_table(ml):
+    summary = MutantListSummary.objects.filter(mutantlist=ml).first()
+    if summary is None:
+        return None
+    return summary.table()
 
 
 def software(request, software_id):
     sw = get_object_or_404(Software, pk=software_id)
+    ml = MutantList.objects.filter(software=sw).first()
 
     return render(request,
                   "software/detail.html",
@@ -25,109 +44,48 @@ def software(request, software_id):
                       'exec_insns': sw.instructioncoverage.aggregate(total=Sum('x'), instances=Sum('instances')),
                       'exec_dcsrs': sw.devicecsrcoverage.aggregate(total=Sum('x'), reads=Sum('r'), writes=Sum('w')),
                       'exec_mr': sw.memoryregioncoverage.aggregate(total=Sum('x'), reads=Sum('r'), writes=Sum('w')),
+
+                      'ml': ml,
+                      'outcomes': outcome_table(ml) if ml is not None else None,
                   })
 
 
 def softwarelist(request, softwarelist_id):
     slist = get_object_or_404(SoftwareList, pk=softwarelist_id)
-    arch = slist.software.first().arch
-
-    covered_gprs = set(GprCoverage.objects.filter(
-        software__softwarelist=slist).values_list("register__name", flat=True))
-    covered_fprs = set(FprCoverage.objects.filter(
-        software__softwarelist=slist).values_list("register__name", flat=True))
-    covered_csrs = set(CsrCoverage.objects.filter(
-        software__softwarelist=slist).values_list("register__name", flat=True))
-    covered_dcsrs = set(DeviceCsrCoverage.objects.filter(
-        software__softwarelist=slist).values_list("register__name", flat=True))
-    covered_mr = set(MemoryRegionCoverage.objects.filter(
-        software__softwarelist=slist).values_list("memory_region__name", flat=True))
-
-    summary_insn_all = slist.get_summary_instructions()
-    summary_insn_i = slist.get_summary_instructions(subset="I")
-    summary_insn_icsr = slist.get_summary_instructions(subset="Zicsr")
-    summary_insn_ifencei = slist.get_summary_instructions(subset="Zifencei")
-    summary_insn_m = slist.get_summary_instructions(subset="M")
-    summary_insn_a = slist.get_summary_instructions(subset="A")
-    summary_insn_f = slist.get_summary_instructions(subset="F")
-    summary_insn_d = slist.get_summary_instructions(subset="D")
-    summary_insn_c = slist.get_summary_instructions(subset="C")
-    summary_insn_machine = slist.get_summary_instructions(subset="M-mode")
-
-    all_gprs = set(Gpr.objects.filter(subset__arch=arch).values_list("name", flat=True))
-    all_fprs = set(Fpr.objects.filter(subset__arch=arch).values_list("name", flat=True))
-    all_csrs = set(Csr.objects.filter(subset__arch=arch).values_list("name", flat=True))
-    all_dcsrs = set(DeviceCsr.objects.filter(device__arch=arch).values_list("name", flat=True))
-    all_mr = set(MemoryRegion.objects.filter(arch=arch).values_list("name", flat=True))
-
-    r_gprs = "{0:0.2f}".format(100.0 * len(covered_gprs)/max(1, len(all_gprs)))
-    r_fprs = "{0:0.2f}".format(100.0 * len(covered_fprs)/max(1, len(all_fprs)))
-    r_csrs = "{0:0.2f}".format(100.0 * len(covered_csrs)/max(1, len(all_csrs)))
-    r_dcsrs = "{0:0.2f}".format(100.0 * len(covered_dcsrs)/max(1, len(all_dcsrs)))
-    r_mr = "{0:0.2f}".format(100.0 * len(covered_mr)/max(1, len(all_mr)))
+    context = {'slist': slist}
+    context.update(coverage.summary(slist))
+    return render(request, "software/list.html", context)
 
-    return render(request,
-                  "software/list.html",
-                  {
-                      'arch': arch,
-                      'slist': slist,
-
-                      'covered_gprs': sorted(covered_gprs),
-                      'covered_fprs': sorted(covered_fprs),
-                      'covered_csrs': sorted(covered_csrs),
-                      'covered_dcsrs': sorted(covered_dcsrs),
-                      'covered_mr': sorted(covered_mr),
-
-                      'missing_gprs': sorted(all_gprs-covered_gprs),
-                      'missing_fprs': sorted(all_fprs-covered_fprs),
-                      'missing_csrs': sorted(all_csrs-covered_csrs),
-                      'missing_dcsrs': sorted(all_dcsrs-covered_dcsrs),
-                      'missing_mr': sorted(all_mr-covered_mr),
-
-                      'covered_instructions': summary_insn_all['cov'],
-                      'covered_instructions_rv32i': summary_insn_i['cov'],
-                      'covered_instructions_rv32icsr': summary_insn_icsr['cov'],
-                      'covered_instructions_rv32ifencei': summary_insn_ifencei['cov'],
-                      'covered_instructions_rv32m': summary_insn_m['cov'],
-                      'covered_instructions_rv32a': summary_insn_a['cov'],
-                      'covered_instructions_rv32f': summary_insn_f['cov'],
-                      'covered_instructions_rv32d': summary_insn_d['cov'],
-                      'covered_instructions_rv32c': summary_insn_c['cov'],
-                      'covered_instructions_machine': summary_insn_machine['cov'],
-
-                      'missing_instructions': summary_insn_all['mis'],
-                      'missing_instructions_rv32i': summary_insn_i['mis'],
-                      'missing_instructions_rv32icsr': summary_insn_icsr['mis'],
-                      'missing_instructions_rv32ifencei': summary_insn_ifencei['mis'],
-                      'missing_instructions_rv32m': summary_insn_m['mis'],
-                      'missing_instructions_rv32a': summary_insn_a['mis'],
-                      'missing_instructions_rv32f': summary_insn_f['mis'],
-                      'missing_instructions_rv32d': summary_insn_d['mis'],
-                      'missing_instructions_rv32c': summary_insn_c['mis'],
-                      'missing_instructions_machine': summary_insn_machine['mis'],
-
-                      'r_gprs': r_gprs,
-                      'r_fprs': r_fprs,
-                      'r_csrs': r_csrs,
-                      'r_dcsrs': r_dcsrs,
-                      'r_mr': r_mr,
-
-                      'r_instructions': summary_insn_all['ratio'],
-                      'r_instructions_rv32i': summary_insn_i['ratio'],
-                      'r_instructions_rv32icsr': summary_insn_icsr['ratio'],
-                      'r_instructions_rv32ifencei': summary_insn_ifencei['ratio'],
-                      'r_instructions_rv32m': summary_insn_m['ratio'],
-                      'r_instructions_rv32a': summary_insn_a['ratio'],
-                      'r_instructions_rv32f': summary_insn_f['ratio'],
-                      'r_instructions_rv32d': summary_insn_d['ratio'],
-                      'r_instructions_rv32c': summary_insn_c['ratio'],
-                      'r_instructions_machine': summary_insn_machine['ratio'],
-                  })
+
+MUTANTS_PER_PAGE = 500
+EXPORT_FIELDS = ['id', 'kind', 'nr_or_address', 'access_idx', 'bitflip', 'detected_error', 'runtime']
+
+
+def filtered_mutants(request, ml):
+    return ml.results().search(request.GET.get('kind'), request.GET.get('outcome'), request.GET.get('address'))
 
 
 def mutantlist(request, mutantlist_id):
     ml = get_object_or_404(MutantList, pk=mutantlist_id)
-    mutants = list(ml.mutants.order_by("id", "kind", "nr_or_address"))
+    try:
+        after = int(request.GET.get('after', 0))
+        rows, next_after = filtered_mutants(request, ml).page(after, MUTANTS_PER_PAGE)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid filter value.")
+
+    mutants = [{
+        'id': r[0],
+        'kind': Mutant.Kind(r[1]).label,
+        'hex': r[1] in HEX_ADDRESS_KINDS,
+        'nr_or_address': r[2],
+        'access_idx': r[3],
+        'bitflip': r[4],
+        'detected_error': Outcome.objects.text(r[5]),
+        'runtime': r[6],
+    } for r in rows]
+
+    filters = request.GET.copy()
+    filters.pop('after', None)
 
     return render(request,
                   "mutants/list.html",
@@ -135,4 +93,49 @@ def mutantlist(request, mutantlist_id):
                       'arch': ml.software.arch,
                       'ml': ml,
                       'mutants': mutants,
+                      'next_after': next_after,
+                      'filters': filters,
+                      'query': filters.urlencode(),
+                      'kinds': Mutant.Kind.choices,
+                      'outcome_texts': Outcome.objects.order_by('text').values_list('text', flat=True),
+                      'outcomes': outcome_table(ml),
                   })
+
+
+class Echo:
+    # Pseudo-buffer for csv.writer (StreamingHttpResponse)
+    def write(self, value):
+        return value
+
+
+def mutantlist_export(request, mutantlist_id, fmt):
+    ml = get_object_or_404(MutantList, pk=mutantlist_id)
+    try:
+        mutants = filtered_mutants(request, ml).order_by('id').values_list(
+            'id', 'kind', 'nr_or_address', 'access_idx', 'bitflip', 'outcome', 'runtime')
+    except ValueError:
+        return HttpResponseBadRequest("Invalid filter value.")
+
+    def rows():
+        for r in mutants.iterator(chunk_size=5000):
+            yield r[:5] + (Outcome.objects.text(r[5]), r[6])
+
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        content = itertools.chain([writer.writerow(EXPORT_FIELDS)], (writer.writerow(r) for r in rows()))
+        response = StreamingHttpResponse(content, content_type="text/csv")
+    else:
+        content = (json.dumps(dict(zip(EXPORT_FIELDS, r))) + "\n" for r in rows())
+        response = StreamingHttpResponse(content, content_type="application/x-ndjson")
+    response['Content-Disposition'] = 'attachment; filename="{}_{}.{}"'.format(ml.pk, ml.software.name, fmt)
+    return response
+
+
+def metrics_export(request, fmt, software_id=None):
+    # Stage metrics of one program (or all programs) as JSON lines or Prometheus text format
+    metrics = StageMetric.objects.all()
+    if software_id is not None:
+        metrics = metrics.filter(software=get_object_or_404(Software, pk=software_id))
+    if fmt == 'jsonl':
+        return StreamingHttpResponse(as_jsonl(metrics), content_type="application/x-ndjson")
+    return StreamingHttpResponse(as_prometheus(metrics), content_type="text/plain; version=0.0.4")